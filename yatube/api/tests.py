@@ -0,0 +1,156 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+from yatube.settings import COUNT_LISTS
+
+User = get_user_model()
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=cls.author, group=cls.group)
+            for number in range(COUNT_LISTS + 3)
+        )
+        cls.post = Post.objects.create(
+            text='Последний пост', author=cls.author, group=cls.group)
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_posts_cursor_pagination(self):
+        response = self.client.get(reverse('api:posts'))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['results']), COUNT_LISTS)
+        self.assertEqual(data['results'][0]['id'], self.post.pk)
+        self.assertEqual(data['results'][0]['author'], 'author')
+        self.assertEqual(data['results'][0]['group'], 'group')
+        self.assertIsNone(data['previous'])
+        second = self.client.get(data['next']).json()
+        self.assertEqual(len(second['results']), 4)
+        self.assertIsNone(second['next'])
+        ids = [post['id'] for post in data['results'] + second['results']]
+        self.assertEqual(len(set(ids)), Post.objects.count())
+
+    def test_posts_filters(self):
+        other = User.objects.create_user(username='other')
+        Post.objects.create(text='Чужой пост', author=other)
+        response = self.client.get(reverse('api:posts'), {'author': 'other'})
+        self.assertEqual(
+            [post['text'] for post in response.json()['results']],
+            ['Чужой пост'])
+        response = self.client.get(reverse('api:posts'), {'group': 'none'})
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('detail', response.json())
+
+    def test_sparse_fieldset(self):
+        url = reverse('api:post', kwargs={'post_id': self.post.pk})
+        response = self.client.get(url, {'fields': 'id,text'})
+        self.assertEqual(
+            response.json(), {'id': self.post.pk, 'text': 'Последний пост'})
+        response = self.client.get(url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_not_modified(self):
+        url = reverse('api:posts')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertIn('Last-Modified', response)
+        # ETag берётся из поколения ленты: ни одного запроса к базе
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+        self.assertEqual(cached['ETag'], etag)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный пост'
+        post.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_etag_follows_versions(self):
+        """Новый комментарий, смена имени комментатора и новая группа
+        меняют ETag, а до того клиент получает 304."""
+        comments = reverse('api:comments', kwargs={'post_id': self.post.pk})
+        groups = reverse('api:groups')
+        etags = {url: self.client.get(url)['ETag'] for url in (
+            comments, groups)}
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Ответ')
+        response = self.client.get(
+            comments, HTTP_IF_NONE_MATCH=etags[comments])
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.reader.username = 'renamed'
+        self.reader.save()
+        response = self.client.get(comments, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('renamed', [
+            comment['author'] for comment in response.json()['results']])
+        Group.objects.create(title='Ещё группа', slug='more')
+        response = self.client.get(groups, HTTP_IF_NONE_MATCH=etags[groups])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_comments(self):
+        url = reverse('api:comments', kwargs={'post_id': self.post.pk})
+        results = self.client.get(url).json()['results']
+        self.assertEqual(results[0]['text'], 'Комментарий')
+        self.assertEqual(results[0]['author'], 'reader')
+        missing = reverse('api:comments', kwargs={'post_id': 0})
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_groups(self):
+        self.assertEqual(
+            self.client.get(reverse('api:groups')).json()['results'],
+            [{'slug': 'group', 'title': 'Группа', 'description': 'Описание'}])
+        response = self.client.get(
+            reverse('api:group', kwargs={'slug': 'group'}))
+        self.assertEqual(response.json()['title'], 'Группа')
+
+    def test_user_following(self):
+        url = reverse('api:user', kwargs={'username': 'author'})
+        self.assertFalse(self.client.get(url).json()['following'])
+        self.client.force_login(self.reader)
+        data = self.client.get(url).json()
+        self.assertTrue(data['following'])
+        self.assertEqual(data['posts_count'], 1)
+        self.assertEqual(data['followers_count'], 1)
+
+    def test_follow_feed(self):
+        url = reverse('api:follow')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.reader)
+        response = self.client.get(url)
+        self.assertEqual(response.json()['results'][0]['id'], self.post.pk)
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+        # Только сессия и пользователь: сама лента не читается
+        with self.assertNumQueries(2):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        new = Post.objects.create(text='Новый пост', author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['id'], new.pk)
+
+    def test_read_only(self):
+        response = self.client.post(reverse('api:posts'), {'text': 'Пост'})
+        self.assertEqual(response.status_code, 405)
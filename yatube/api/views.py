@@ -0,0 +1,295 @@
+import hashlib
+from contextlib import nullcontext
+from functools import wraps
+
+from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from core.db import use_primary
+from core.paginator import page_query, paginate
+from posts.cards import VERSION_KEY, card_keys, changed_recently, get_versions
+from posts.counters import get_counters
+from posts.feeds import feed
+from posts.hot import get_group, get_post
+from posts.models import Follow, Group
+from posts.page_cache import feed_changed, feed_generation
+from posts.timeline import TimelinePaginator
+from posts.views import comment_page
+
+User = get_user_model()
+
+# Поля ресурсов: имя в JSON и как его получить из объекта.
+# Клиент выбирает нужные параметром ?fields=id,text
+POST_FIELDS = {
+    'id': lambda post: post.pk,
+    'text': lambda post: post.text,
+    'pub_date': lambda post: post.pub_date.isoformat(),
+    'author': lambda post: post.author.username,
+    'group': lambda post: post.group.slug if post.group_id else None,
+    'image': lambda post: post.image.url if post.image else None,
+}
+COMMENT_FIELDS = {
+    'id': lambda comment: comment.pk,
+    'post': lambda comment: comment.post_id,
+    'author': lambda comment: comment.author.username,
+    'text': lambda comment: comment.text,
+    'created': lambda comment: comment.created.isoformat(),
+}
+GROUP_FIELDS = {
+    'slug': lambda group: group.slug,
+    'title': lambda group: group.title,
+    'description': lambda group: group.description,
+}
+USER_FIELDS = {
+    'username': lambda user: user.username,
+    'first_name': lambda user: user.first_name,
+    'last_name': lambda user: user.last_name,
+    'posts_count': lambda user: user.post_counters.posts_count,
+    'followers_count': lambda user: user.post_counters.followers_count,
+    'following_count': lambda user: user.post_counters.following_count,
+    'following': lambda user: getattr(user, 'is_followed', False),
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def api_view(view):
+    """Только GET и HEAD; ошибки — в JSON, а не страницей сайта."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except Http404 as error:
+            return error_response(404, str(error) or 'Не найдено')
+        except ApiError as error:
+            return error_response(error.status, error.detail)
+    return wrapper
+
+
+def error_response(status, detail):
+    return JsonResponse(
+        {'detail': detail},
+        status=status,
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+def fieldset(request, fields):
+    """Поля из ?fields=, по умолчанию — все."""
+    names = [
+        name.strip() for name in request.GET.get('fields', '').split(',')
+        if name.strip()
+    ]
+    if not names:
+        return list(fields)
+    unknown = sorted(set(names) - fields.keys())
+    if unknown:
+        raise ApiError(400, 'Неизвестные поля: ' + ', '.join(unknown))
+    return names
+
+
+def represent(obj, fields, names):
+    return {name: fields[name](obj) for name in names}
+
+
+def respond(request, build, versions=(), feeds=(), private=False):
+    """Ответ JSON с сильным ETag и Last-Modified.
+
+    ETag считается до всякой работы, как у HTML-страниц: из версий
+    карточек и комментариев (ключи VERSION_KEY в versions) и поколений
+    лент feeds. Если он совпал с If-None-Match, клиент получает 304,
+    а build — запросы к базе и сборка данных — не вызывается.
+    build() возвращает данные и дату для Last-Modified или None.
+    private — ответ зависит от клиента, его id входит в ETag.
+    If-Modified-Since не проверяется: правка или удаление поста
+    не меняют дат в выдаче, поэтому Last-Modified только сообщается.
+    """
+    versions = list(versions)
+    current = get_versions(versions)
+    state = (
+        [current[key] for key in versions],
+        [feed_generation(scope) for scope in feeds],
+        request.user.pk if private else None,
+        request.get_full_path(),
+    )
+    etag = quote_etag(hashlib.md5(repr(state).encode()).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        # Отстающая реплика отдала бы под новым ETag старые данные
+        changed = changed_recently(versions) or any(
+            feed_changed(scope) for scope in feeds)
+        with use_primary() if changed else nullcontext():
+            data, last_modified = build()
+        response = JsonResponse(
+            data, json_dumps_params={'ensure_ascii': False})
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+    response['ETag'] = etag
+    # Ответ можно хранить, но перед показом — сверить ETag
+    patch_cache_control(response, no_cache=True)
+    if private:
+        patch_cache_control(response, private=True)
+    return response
+
+
+def _link(request, cursor):
+    if cursor is None:
+        return None
+    query = page_query(request, cursor=cursor, page=None)
+    return request.build_absolute_uri(f'{request.path}{query}')
+
+
+def page_data(request, page, fields, names, date_field):
+    data = {
+        'results': [represent(obj, fields, names) for obj in page],
+        'next': _link(request, page.next_cursor),
+        'previous': _link(request, page.previous_cursor),
+    }
+    last_modified = max(
+        (getattr(obj, date_field) for obj in page), default=None)
+    return data, last_modified
+
+
+@api_view
+def posts(request):
+    """Лента постов, ?group=slug и ?author=username сужают её.
+
+    Лента меняется вместе с одноимённой HTML-страницей, поэтому ETag
+    строится из поколения той же ленты.
+    """
+    names = fieldset(request, POST_FIELDS)
+    slug = request.GET.get('group')
+    username = request.GET.get('author')
+    scopes = [
+        *([f'group:{slug}'] if slug else []),
+        *([f'profile:{username}'] if username else []),
+    ]
+
+    def build():
+        filters = {}
+        if slug:
+            filters['group'] = get_group(slug)
+        if username:
+            filters['author'] = get_object_or_404(User, username=username)
+        page = paginate(request, feed(**filters))
+        return page_data(request, page, POST_FIELDS, names, 'pub_date')
+
+    return respond(request, build, feeds=scopes or ['index'])
+
+
+@api_view
+def post(request, post_id):
+    names = fieldset(request, POST_FIELDS)
+    post = get_post(post_id)
+    return respond(
+        request,
+        lambda: (represent(post, POST_FIELDS, names), post.pub_date),
+        versions=card_keys(post),
+    )
+
+
+@api_view
+def comments(request, post_id):
+    names = fieldset(request, COMMENT_FIELDS)
+    get_post(post_id)
+
+    def build():
+        page = comment_page(request, post_id)
+        return page_data(request, page, COMMENT_FIELDS, names, 'created')
+
+    # Версию комментариев меняет и смена имени их автора
+    return respond(
+        request,
+        build,
+        versions=[VERSION_KEY.format(kind='comments', pk=post_id)],
+    )
+
+
+@api_view
+def groups(request):
+    names = fieldset(request, GROUP_FIELDS)
+
+    def build():
+        return {
+            'results': [
+                represent(group, GROUP_FIELDS, names)
+                for group in Group.objects.order_by('title')
+            ],
+        }, None
+
+    return respond(request, build, feeds=['groups'])
+
+
+@api_view
+def group(request, slug):
+    names = fieldset(request, GROUP_FIELDS)
+    group = get_group(slug)
+    return respond(
+        request,
+        lambda: (represent(group, GROUP_FIELDS, names), None),
+        versions=[VERSION_KEY.format(kind='group', pk=group.pk)],
+    )
+
+
+@api_view
+def user(request, username):
+    """Автор со счётчиками; following — подписан ли на него клиент.
+
+    Счётчики и подписки меняются вместе с HTML-страницей профиля:
+    ETag строится из поколения её ленты.
+    """
+    names = fieldset(request, USER_FIELDS)
+    following = 'following' in names and request.user.is_authenticated
+
+    def build():
+        authors = User.objects.select_related('counters')
+        if following:
+            authors = authors.annotate(is_followed=Exists(
+                Follow.objects.filter(
+                    author=OuterRef('pk'), user=request.user)))
+        author = get_object_or_404(authors, username=username)
+        author.post_counters = get_counters(author)
+        return represent(author, USER_FIELDS, names), None
+
+    return respond(
+        request, build, feeds=[f'profile:{username}'], private=following)
+
+
+@api_view
+def follow(request):
+    """Лента подписок клиента, как на странице /follow/.
+
+    Поколение timeline:{id} меняют задачи, которые пишут в ленту,
+    и подписки. Поколение 'index' — правки карточек и новые посты
+    популярных авторов: их посты подмешиваются при чтении.
+    """
+    if not request.user.is_authenticated:
+        raise ApiError(401, 'Нужно войти на сайт')
+    names = fieldset(request, POST_FIELDS)
+
+    def build():
+        page = paginate(
+            request,
+            request.user.timeline.all(),
+            paginator_class=TimelinePaginator,
+            user=request.user,
+        )
+        return page_data(request, page, POST_FIELDS, names, 'pub_date')
+
+    return respond(
+        request,
+        build,
+        feeds=[f'timeline:{request.user.pk}', 'index'],
+        private=True,
+    )
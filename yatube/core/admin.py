@@ -0,0 +1,30 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'name',
+        'status',
+        'attempts',
+        'run_at',
+        'created'
+    )
+    search_fields = ('name', 'key')
+    list_filter = ('status', 'name')
+    actions = ['retry']
+
+    def retry(self, request, queryset):
+        queryset.update(
+            status=Job.QUEUED,
+            attempts=0,
+            run_at=timezone.now(),
+            locked_until=None,
+        )
+    retry.short_description = 'Выполнить заново'
+
+
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,208 @@
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Тело запроса до этого размера держится в памяти, больше — во временном
+# файле, как у загрузок Django
+BODY_IN_MEMORY = 2 ** 20
+# На сколько частей ответа поток запроса может обогнать отправку
+# клиенту: медленный клиент не заставляет держать весь ответ в памяти
+RESPONSE_CHUNKS = 8
+
+
+def build_environ(scope, body):
+    """WSGI environ из ASGI scope запроса HTTP."""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # WSGI передаёт путь байтами UTF-8 в строке latin-1
+        'SCRIPT_NAME': root_path.encode().decode('latin-1'),
+        'PATH_INFO': path.encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin-1')
+        if name in environ:
+            value = f'{environ[name]},{value}'
+        environ[name] = value
+    return environ
+
+
+class WsgiResponse:
+    """Ответ WSGI-приложения, который отправляется сообщениями ASGI.
+
+    Заголовки уходят с первой частью тела: до неё приложение может
+    заменить их, снова вызвав start_response с exc_info.
+    """
+
+    def __init__(self, send):
+        self.send = send
+        self.status = None
+        self.headers = None
+        self.headers_sent = False
+
+    def start_response(self, status, headers, exc_info=None):
+        if exc_info:
+            try:
+                if self.headers_sent:
+                    # Заголовки уже у клиента: ответ не исправить
+                    raise exc_info[1].with_traceback(exc_info[2])
+            finally:
+                exc_info = None
+        self.status = int(status.split(' ', 1)[0])
+        self.headers = [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers
+        ]
+
+    def write(self, chunk, more_body=True):
+        if not self.headers_sent:
+            self.send({
+                'type': 'http.response.start',
+                'status': self.status,
+                'headers': self.headers,
+            })
+            self.headers_sent = True
+        self.send({
+            'type': 'http.response.body',
+            'body': chunk,
+            'more_body': more_body,
+        })
+
+
+class AsgiHandler:
+    """ASGI-приложение поверх WSGI-приложения Django.
+
+    Django 2.2 не умеет асинхронных view и ORM, поэтому запрос целиком
+    выполняется в пуле из threads потоков, а цикл событий сервера тем
+    временем принимает соединения и читает тела других запросов:
+    медленный клиент не занимает поток.
+    """
+
+    def __init__(self, wsgi_application, threads):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(
+            threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f'Неподдерживаемое соединение: {scope["type"]}')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # Ждём запросы в другом потоке: отдающему ответ потоку
+                # нужен цикл событий, чтобы дописать его
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        body = await self.read_body(receive)
+        if body is None:
+            # Клиент ушёл, не дослав запрос
+            return
+        loop = asyncio.get_running_loop()
+        messages = asyncio.Queue(RESPONSE_CHUNKS)
+        environ = build_environ(scope, body)
+
+        def put(message):
+            asyncio.run_coroutine_threadsafe(
+                messages.put(message), loop).result()
+
+        def respond():
+            try:
+                self.run(environ, put)
+            finally:
+                put(None)
+
+        response = loop.run_in_executor(self.executor, respond)
+        message = {}
+        try:
+            while True:
+                message = await messages.get()
+                if message is None:
+                    break
+                if scope['method'] == 'HEAD' and 'body' in message:
+                    if message['more_body']:
+                        continue
+                    message = {**message, 'body': b''}
+                await send(message)
+        finally:
+            # Отправка прервалась: дочитываем ответ, чтобы поток
+            # не ждал места в очереди и закрыл ответ
+            while message is not None:
+                message = await messages.get()
+            try:
+                await response
+            finally:
+                body.close()
+
+    async def read_body(self, receive):
+        body = tempfile.SpooledTemporaryFile(max_size=BODY_IN_MEMORY)
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            body.write(message.get('body', b''))
+            if not message.get('more_body'):
+                body.seek(0)
+                return body
+
+    def run(self, environ, send):
+        """Выполняет запрос в потоке пула и передаёт ответ в send
+        по частям, по мере того как их отдаёт WSGI-приложение:
+        FileResponse и StreamingHttpResponse не собираются в памяти.
+
+        Ответ закрывается в том же потоке: по сигналу request_finished
+        Django закрывает соединения с базой этого потока.
+        """
+        response = WsgiResponse(send)
+        result = self.wsgi_application(environ, response.start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    response.write(chunk)
+            response.write(b'', more_body=False)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+def get_asgi_application():
+    """ASGI-приложение проекта: как get_wsgi_application, но для
+    uvicorn, daphne и других ASGI-серверов."""
+    from django.conf import settings
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+    return AsgiHandler(application, settings.ASGI_THREADS)
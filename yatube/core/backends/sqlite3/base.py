@@ -0,0 +1,67 @@
+import threading
+
+from django.db.backends.sqlite3 import base
+
+# Очереди записи по файлам баз: один пишущий поток на процесс
+_write_locks = {}
+_write_locks_guard = threading.Lock()
+
+
+def write_lock(name):
+    with _write_locks_guard:
+        return _write_locks.setdefault(name, threading.Lock())
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite с настройками соединения из DATABASES.
+
+    PRAGMAS выполняются на каждом новом соединении. TRANSACTION_MODE
+    задаёт вид BEGIN для atomic: с IMMEDIATE транзакция сразу берёт
+    блокировку записи и ждёт её busy_timeout, а не получает
+    «database is locked», когда читающая транзакция начинает писать.
+    WRITE_QUEUE пропускает транзакции потоков процесса по одной.
+    Поэтому atomic должен охватывать только запись: всё, что внутри
+    него, задерживает остальных писателей.
+    """
+
+    _holds_write_lock = False
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict.get('PRAGMAS', {}).items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        if self.settings_dict.get('WRITE_QUEUE'):
+            write_lock(self.settings_dict['NAME']).acquire()
+            self._holds_write_lock = True
+        mode = self.settings_dict.get('TRANSACTION_MODE')
+        try:
+            self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
+        except Exception:
+            self._release_write_lock()
+            raise
+
+    def _release_write_lock(self):
+        if self._holds_write_lock:
+            self._holds_write_lock = False
+            write_lock(self.settings_dict['NAME']).release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._release_write_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_write_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_write_lock()
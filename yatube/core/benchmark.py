@@ -0,0 +1,181 @@
+import json
+import multiprocessing
+import random
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import OperationalError, connection
+from django.template.backends.django import Template
+
+
+class Measurement:
+    """Запросы, время SQL и рендеринга шаблонов за один вызов."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.render_ms = 0.0
+        self.total_ms = 0.0
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'sql_ms': round(self.sql_ms, 2),
+            'render_ms': round(self.render_ms, 2),
+            'total_ms': round(self.total_ms, 2),
+        }
+
+
+@contextmanager
+def measure():
+    measurement = Measurement()
+    render = Template.render
+    depth = 0
+
+    def timed_render(template, *args, **kwargs):
+        # Виджеты форм рендерятся тем же движком внутри страницы:
+        # считаем только внешний вызов
+        nonlocal depth
+        depth += 1
+        started = time.perf_counter()
+        try:
+            return render(template, *args, **kwargs)
+        finally:
+            depth -= 1
+            if not depth:
+                measurement.render_ms += (
+                    time.perf_counter() - started) * 1000
+
+    def timed_query(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            measurement.queries += 1
+            measurement.sql_ms += (time.perf_counter() - started) * 1000
+
+    Template.render = timed_render
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(timed_query):
+            yield measurement
+    finally:
+        measurement.total_ms = (time.perf_counter() - started) * 1000
+        Template.render = render
+
+
+def write_report(path, volumes, results):
+    """Сохраняет результаты замеров в JSON для сравнения между запусками."""
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'volumes': volumes,
+        'routes': results,
+    }
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+
+
+class Throughput:
+    """Итог смешанной нагрузки: операции, ошибки и задержки по видам."""
+
+    def __init__(self):
+        self.latencies = {'read': [], 'write': []}
+        self.errors = {'read': 0, 'write': 0}
+        self.seconds = 0.0
+
+    def as_dict(self):
+        result = {'seconds': round(self.seconds, 2)}
+        for kind, latencies in self.latencies.items():
+            ordered = sorted(latencies) or [0.0]
+            result[kind] = {
+                'ops': len(latencies),
+                'ops_per_second': round(len(latencies) / self.seconds, 1),
+                'errors': self.errors[kind],
+                'p50_ms': round(statistics.median(ordered), 2),
+                'p95_ms': round(ordered[int(len(ordered) * 0.95) - 1], 2),
+            }
+        return result
+
+
+def _run_threads(read, write, threads, deadline, write_ratio, seed):
+    latencies = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+
+    def worker(number):
+        chooser = random.Random(seed + number)
+        own = {'read': [], 'write': []}
+        failed = {'read': 0, 'write': 0}
+        try:
+            while time.perf_counter() < deadline:
+                kind = 'write' if chooser.random() < write_ratio else 'read'
+                started = time.perf_counter()
+                try:
+                    (write if kind == 'write' else read)(chooser)
+                except OperationalError:
+                    failed[kind] += 1
+                    continue
+                own[kind].append((time.perf_counter() - started) * 1000)
+        finally:
+            connection.close()
+        with lock:
+            for kind in own:
+                latencies[kind] += own[kind]
+                errors[kind] += failed[kind]
+
+    pool = [
+        threading.Thread(target=worker, args=(number,))
+        for number in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return latencies, errors
+
+
+def mixed_load(read, write, processes=1, threads=8, seconds=10.0,
+               write_ratio=0.2, seed=0):
+    """Гоняет read() и write() из processes процессов по threads потоков
+    seconds секунд.
+
+    Каждый поток работает через своё соединение с базой, как воркеры
+    gunicorn. Ошибки OperationalError («database is locked») считаются,
+    а не прерывают замер.
+    """
+    result = Throughput()
+    started = time.perf_counter()
+    deadline = started + seconds
+    parts = []
+    if processes == 1:
+        parts.append(_run_threads(
+            read, write, threads, deadline, write_ratio, seed))
+    else:
+        # Дочерние процессы получают копию Django через fork:
+        # открытое соединение им не передаём
+        connection.close()
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+
+        def child(number):
+            queue.put(_run_threads(
+                read, write, threads, deadline, write_ratio,
+                seed + number * threads))
+
+        children = [
+            context.Process(target=child, args=(number,))
+            for number in range(processes)
+        ]
+        for process in children:
+            process.start()
+        parts = [queue.get() for _ in children]
+        for process in children:
+            process.join()
+    for latencies, errors in parts:
+        for kind in latencies:
+            result.latencies[kind] += latencies[kind]
+            result.errors[kind] += errors[kind]
+    result.seconds = time.perf_counter() - started
+    return result
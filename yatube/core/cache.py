@@ -0,0 +1,508 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from urllib.parse import urlsplit
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import MemcachedCache, PyLibMCCache
+
+COMPRESS_MIN_LENGTH = 4096
+CULL_EVERY = 100
+# Сколько последних инвалидаций хранится в L2 для остальных воркеров
+INVALIDATION_RING = 1000
+# Схемы без атомарного incr(): кэш приложений на нём строит версии
+# карточек, поколения лент и журнал инвалидаций TieredCache
+NON_ATOMIC_INCR = {'file'}
+
+BACKENDS = {
+    'locmem': 'core.cache.CompressedLocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'core.cache.SQLiteCache',
+    'memcached': 'core.cache.CompressedMemcachedCache',
+    'pylibmc': 'core.cache.CompressedPyLibMCCache',
+}
+
+
+def cache_config(url, key_prefix='', apps=(),
+                 compress_min_length=COMPRESS_MIN_LENGTH):
+    """Собирает settings.CACHES из адреса вида `схема://расположение`.
+
+    locmem://имя — память процесса (разработка и тесты);
+    sqlite:///файл — общий кэш процессов одного сервера;
+    memcached://host:port,host:port и pylibmc://... — кластер.
+    file:///каталог годится только без `apps`: у FileBasedCache нет
+    атомарного incr() и сжатия.
+    Для каждого приложения из `apps` заводится алиас с тем же хранилищем
+    и своим префиксом ключей.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in BACKENDS:
+        raise ValueError(f'Неизвестная схема кэша: {url}')
+    if apps and parts.scheme in NON_ATOMIC_INCR:
+        raise ValueError(
+            f'{parts.scheme}:// не поддерживает атомарный incr(), нужный '
+            f'кэшу приложений {", ".join(apps)}: используйте sqlite://')
+    if parts.scheme in ('file', 'sqlite'):
+        location = parts.path
+    elif parts.scheme == 'locmem':
+        location = parts.netloc
+    else:
+        location = parts.netloc.split(',')
+    base = {
+        'BACKEND': BACKENDS[parts.scheme],
+        'LOCATION': location,
+        'COMPRESS_MIN_LENGTH': compress_min_length,
+    }
+    config = {'default': dict(base, KEY_PREFIX=key_prefix)}
+    for app in apps:
+        prefix = f'{key_prefix}:{app}' if key_prefix else app
+        config[app] = dict(base, KEY_PREFIX=prefix)
+    return config
+
+
+def app_cache(label):
+    """Кэш с пространством ключей приложения, если оно настроено."""
+    from django.conf import settings
+    return caches[label if label in settings.CACHES else 'default']
+
+
+class Compressed(bytes):
+    """Сжатое pickle-представление значения."""
+
+
+class CompressionMixin:
+    """Сжимает zlib значения, которые в pickle больше порога."""
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        self.compress_min_length = params.get(
+            'COMPRESS_MIN_LENGTH', COMPRESS_MIN_LENGTH)
+
+    def _pack(self, value):
+        if isinstance(value, (bool, int, float)):
+            # Числа должны оставаться числами для incr()
+            return value
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) < self.compress_min_length:
+            return value
+        return Compressed(zlib.compress(data))
+
+    def _unpack(self, value):
+        if isinstance(value, Compressed):
+            return pickle.loads(zlib.decompress(value))
+        return value
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return super().add(key, self._pack(value), timeout, version)
+
+    def get(self, key, default=None, version=None):
+        return self._unpack(super().get(key, default, version))
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return super().set(key, self._pack(value), timeout, version)
+
+    def get_many(self, keys, version=None):
+        return {
+            key: self._unpack(value)
+            for key, value in super().get_many(keys, version).items()
+        }
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        data = {key: self._pack(value) for key, value in data.items()}
+        return super().set_many(data, timeout, version)
+
+
+class CompressedLocMemCache(CompressionMixin, LocMemCache):
+    pass
+
+
+class CompressedMemcachedCache(CompressionMixin, MemcachedCache):
+    pass
+
+
+class CompressedPyLibMCCache(CompressionMixin, PyLibMCCache):
+    pass
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле SQLite, общий для всех воркеров одного сервера.
+
+    В отличие от FileBasedCache, incr() атомарен между процессами, а
+    get_many() и set_many() выполняются одним запросом и одной транзакцией.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self.compress_min_length = params.get(
+            'COMPRESS_MIN_LENGTH', COMPRESS_MIN_LENGTH)
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                'compressed INTEGER NOT NULL, expires REAL)'
+            )
+            self._local.connection = connection
+        return connection
+
+    def _dumps(self, value):
+        data = pickle.dumps(value, self.pickle_protocol)
+        if len(data) >= self.compress_min_length:
+            return zlib.compress(data), 1
+        return data, 0
+
+    @staticmethod
+    def _loads(data, compressed):
+        if compressed:
+            data = zlib.decompress(data)
+        return pickle.loads(data)
+
+    def _alive(self):
+        return '(expires IS NULL OR expires > ?)', time.time()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        data, compressed = self._dumps(value)
+        alive, now = self._alive()
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute(f'DELETE FROM cache WHERE key = ? AND NOT {alive}',
+                       (key, now))
+            cursor = db.execute(
+                'INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?)',
+                (key, data, compressed, self.get_backend_timeout(timeout)))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        alive, now = self._alive()
+        row = self._db.execute(
+            f'SELECT value, compressed FROM cache WHERE key = ? AND {alive}',
+            (key, now)).fetchone()
+        if row is None:
+            return default
+        return self._loads(*row)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        alive, now = self._alive()
+        cursor = self._db.execute(
+            f'UPDATE cache SET expires = ? WHERE key = ? AND {alive}',
+            (self.get_backend_timeout(timeout), key, now))
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def get_many(self, keys, version=None):
+        names = {self.make_key(key, version=version): key for key in keys}
+        for name in names:
+            self.validate_key(name)
+        if not names:
+            return {}
+        alive, now = self._alive()
+        marks = ', '.join('?' * len(names))
+        rows = self._db.execute(
+            f'SELECT key, value, compressed FROM cache '
+            f'WHERE key IN ({marks}) AND {alive}',
+            (*names, now))
+        return {
+            names[name]: self._loads(data, compressed)
+            for name, data, compressed in rows
+        }
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key, *self._dumps(value), expires))
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)', rows)
+            self._cull()
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return []
+
+    def delete_many(self, keys, version=None):
+        names = [self.make_key(key, version=version) for key in keys]
+        for name in names:
+            self.validate_key(name)
+        self._db.executemany(
+            'DELETE FROM cache WHERE key = ?', [(name,) for name in names])
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        alive, now = self._alive()
+        return self._db.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {alive}',
+            (key, now)).fetchone() is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        alive, now = self._alive()
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            row = db.execute(
+                f'SELECT value, compressed FROM cache '
+                f'WHERE key = ? AND {alive}', (key, now)).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._loads(*row) + delta
+            db.execute(
+                'UPDATE cache SET value = ?, compressed = ? WHERE key = ?',
+                (*self._dumps(value), key))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return value
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def _cull(self):
+        # Считать строки на каждую запись дорого: проверяем изредка
+        self._local.writes = getattr(self._local, 'writes', 0) + 1
+        if self._local.writes % CULL_EVERY:
+            return
+        alive, now = self._alive()
+        db = self._db
+        db.execute(f'DELETE FROM cache WHERE NOT {alive}', (now,))
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            db.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,))
+
+
+class _Tier:
+    """Состояние L1 одного процесса, общее для всех потоков."""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.seen = None
+        self.synced_at = 0
+        self.stats = {'l1': Counter(), 'l2': Counter()}
+
+
+# Как у LocMemCache: экземпляры бэкенда создаются на каждый поток,
+# а L1 должен быть один на процесс
+_tiers = {}
+
+
+def tier_stats():
+    """Счётчики попаданий, промахов и вытеснений по уровням кэша."""
+    return {
+        name: {level: dict(counts) for level, counts in tier.stats.items()}
+        for name, tier in _tiers.items()
+    }
+
+
+class TieredCache(BaseCache):
+    """Двухуровневый кэш: LRU в памяти процесса перед общим кэшем.
+
+    LOCATION — алиас общего кэша (L2) из settings.CACHES. Запись в L1
+    живёт не дольше L1_TIMEOUT секунд. set() и delete() на любом воркере
+    публикуются в L2, и остальные воркеры выбрасывают ключ из своего L1
+    при очередной сверке раз в SYNC_INTERVAL секунд.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._l2_alias = location
+        self.l1_timeout = params.get('L1_TIMEOUT', 5)
+        self.sync_interval = params.get('SYNC_INTERVAL', 1)
+        name = f'{location}:{self.key_prefix}'
+        self._tier = _tiers.setdefault(name, _Tier())
+        self.stats = self._tier.stats
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _l1_get(self, key):
+        tier = self._tier
+        with tier.lock:
+            entry = tier.entries.get(key)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires <= time.time():
+                del tier.entries[key]
+                return None
+            tier.entries.move_to_end(key)
+        return data
+
+    def _l1_set(self, key, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        tier = self._tier
+        with tier.lock:
+            tier.entries[key] = (time.time() + self.l1_timeout, data)
+            tier.entries.move_to_end(key)
+            while len(tier.entries) > self._max_entries:
+                tier.entries.popitem(last=False)
+                self.stats['l1']['evictions'] += 1
+
+    def _l1_delete(self, keys):
+        with self._tier.lock:
+            for key in keys:
+                self._tier.entries.pop(key, None)
+
+    def _l1_clear(self):
+        with self._tier.lock:
+            self._tier.entries.clear()
+
+    def _broadcast(self, names):
+        """Сообщает остальным воркерам, что ключи изменились."""
+        if not names:
+            return
+        try:
+            last = self.l2.incr('tier_seq', len(names))
+        except ValueError:
+            self.l2.add('tier_seq', 0, None)
+            last = self.l2.incr('tier_seq', len(names))
+        first = last - len(names) + 1
+        self.l2.set_many({
+            f'tier_inval:{seq % INVALIDATION_RING}': (seq, name)
+            for seq, name in enumerate(names, first)
+        }, None)
+        if self._tier.seen == first - 1:
+            # Между сверками никто больше не писал — свои записи уже учтены
+            self._tier.seen = last
+
+    def _sync(self):
+        tier = self._tier
+        now = time.time()
+        if now - tier.synced_at < self.sync_interval:
+            return
+        tier.synced_at = now
+        seq = self.l2.get('tier_seq', 0)
+        if seq == tier.seen:
+            return
+        if tier.seen is None or not (
+                tier.seen < seq <= tier.seen + INVALIDATION_RING):
+            # Часть инвалидаций потеряна или L2 очищен —
+            # проще начать с чистого L1
+            self._l1_clear()
+        else:
+            slots = [
+                f'tier_inval:{number % INVALIDATION_RING}'
+                for number in range(tier.seen + 1, seq + 1)
+            ]
+            self._l1_delete(
+                name for _, name in self.l2.get_many(slots).values())
+        tier.seen = seq
+
+    def _timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        found = {}
+        missing = []
+        for key in keys:
+            data = self._l1_get(self.make_key(key, version))
+            if data is None:
+                missing.append(key)
+            else:
+                found[key] = pickle.loads(data)
+        self.stats['l1']['hits'] += len(found)
+        self.stats['l1']['misses'] += len(missing)
+        if missing:
+            fetched = self.l2.get_many(missing, version)
+            self.stats['l2']['hits'] += len(fetched)
+            self.stats['l2']['misses'] += len(missing) - len(fetched)
+            for key, value in fetched.items():
+                self._l1_set(self.make_key(key, version), value)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, self._timeout(timeout), version)
+        self._broadcast([self.make_key(key, version) for key in data])
+        for key, value in data.items():
+            self._l1_set(self.make_key(key, version), value)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, self._timeout(timeout), version)
+        if added:
+            self._broadcast([self.make_key(key, version)])
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        # Счётчики живут только в L2: копии в L1 разных воркеров разошлись бы
+        value = self.l2.incr(key, delta, version)
+        names = [self.make_key(key, version)]
+        self._l1_delete(names)
+        self._broadcast(names)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, self._timeout(timeout), version)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.l2.delete_many(keys, version)
+        names = [self.make_key(key, version) for key in keys]
+        self._l1_delete(names)
+        self._broadcast(names)
+
+    def has_key(self, key, version=None):
+        return key in self.get_many([key], version)
+
+    def clear(self):
+        self._l1_clear()
+        self.l2.clear()
@@ -0,0 +1,72 @@
+import hashlib
+from contextlib import nullcontext
+from functools import wraps
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from .db import use_primary
+
+
+def page_etag(request, *state):
+    """Сильный ETag HTML-страницы.
+
+    Кроме версии данных state в хеш входит всё, что ещё попадает
+    в HTML: адрес, пользователь в шапке, токен CSRF в формах и год
+    в подвале.
+    """
+    parts = (
+        state,
+        request.get_full_path(),
+        request.user.pk,
+        request.user.get_username(),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+        timezone.now().year,
+    )
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def not_modified(request, etag):
+    """Ответ 304, если у клиента страница с этим ETag, иначе None."""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(request, etag=etag)
+    return response and validated(request, response, etag)
+
+
+def validated(request, response, etag):
+    """Ставит ETag: браузер хранит страницу, но каждый раз сверяет его."""
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        patch_cache_control(
+            response, no_cache=True, private=request.user.is_authenticated)
+    return response
+
+
+def conditional_page(state, changed=None):
+    """Декоратор view: 304 Not Modified, пока state не изменился.
+
+    state(request, **kwargs) — версии данных страницы. Он должен
+    обходиться без тяжёлых запросов: при совпадении ETag view
+    и шаблон не вызываются. changed(request, **kwargs) — менялись ли
+    эти данные только что: тогда страница читается с основной базы,
+    ведь отстающая реплика отдала бы под новым ETag старые данные,
+    и браузер хранил бы их до следующей записи.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            etag = page_etag(request, state(request, **kwargs))
+            response = not_modified(request, etag)
+            if response is None:
+                primary = changed is not None and changed(request, **kwargs)
+                with use_primary() if primary else nullcontext():
+                    response = view(request, *args, **kwargs)
+                response = validated(request, response, etag)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,70 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.tasks import work
+
+
+SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class Command(BaseCommand):
+    help = ('Выполняет фоновые задачи из очереди в базе '
+            '(TASK_BROKER = core.tasks.DatabaseBroker). SIGTERM и Ctrl+C '
+            'останавливают воркеры после текущей задачи')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2)
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Секунд ждать, когда очередь пуста')
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Выйти, когда готовых задач не останется')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        if processes <= 1:
+            done = self.run(options)
+            self.stdout.write(f'Выполнено задач: {done}')
+            return
+        # Дочерние процессы получают копию Django через fork:
+        # открытые соединения им не передаём
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        children = [
+            context.Process(target=self.run, args=(options,))
+            for _ in range(processes)
+        ]
+        for process in children:
+            process.start()
+
+        def stop(*args):
+            for process in children:
+                process.terminate()
+
+        for signum in SIGNALS:
+            signal.signal(signum, stop)
+        self.stdout.write(f'Запущено воркеров: {processes}')
+        for process in children:
+            process.join()
+
+    def run(self, options):
+        stop = threading.Event()
+        # Задача, которую воркер уже выполняет, доделывается
+        previous = {
+            signum: signal.signal(signum, lambda *args: stop.set())
+            for signum in SIGNALS
+        }
+        try:
+            return work(
+                stop.is_set,
+                poll_interval=options['poll_interval'],
+                burst=options['burst'],
+            )
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
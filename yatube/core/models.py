@@ -0,0 +1,57 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Задача фоновой очереди (core.tasks.DatabaseBroker).
+
+    Выполненные задачи удаляются, исчерпавшие попытки остаются
+    со статусом FAILED и текстом последней ошибки.
+    """
+    QUEUED = 'queued'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'В очереди'),
+        (FAILED, 'Не выполнена'),
+    ]
+
+    name = models.CharField('Задача', max_length=200)
+    args = models.TextField('Аргументы', default='[]')
+    key = models.CharField(
+        'Ключ идемпотентности',
+        max_length=200,
+        blank=True,
+        null=True,
+    )
+    status = models.CharField(
+        'Статус', max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveIntegerField('Попыток не больше')
+    run_at = models.DateTimeField('Выполнить после', default=timezone.now)
+    locked_until = models.DateTimeField(
+        'Занята воркером до', blank=True, null=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        # Воркеры выбирают готовые задачи по (status, run_at)
+        indexes = [
+            models.Index(
+                fields=['status', 'run_at'],
+                name='job_status_run_at_idx'
+            ),
+        ]
+        # Задача с ключом стоит в очереди не больше одного раза
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'],
+                condition=Q(status='queued'),
+                name='unique_queued_job_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
@@ -0,0 +1,177 @@
+import base64
+import binascii
+import json
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from yatube.settings import COUNT_LISTS
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу (дата, pk) вместо LIMIT/OFFSET.
+
+    Каждая страница выбирается одним запросом с условием
+    `(date, pk) < (последняя запись прошлой страницы)`, поэтому глубокие
+    страницы стоят столько же, сколько первая. COUNT(*) выполняется только
+    при `with_count=True`. Возвращается обычный `Page`, к которому
+    добавлены `next_cursor` и `previous_cursor`.
+    """
+    cursor_param = 'cursor'
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 with_count=False):
+        super().__init__(object_list, per_page)
+        self.date_field = date_field
+        self.with_count = with_count
+        self._number = 1
+        self._has_next = False
+
+    @property
+    def num_pages(self):
+        if self.with_count:
+            return super().num_pages
+        # Без подсчёта знаем только, есть ли следующая страница
+        return self._number + 1 if self._has_next else self._number
+
+    def validate_number(self, number):
+        if self.with_count:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            number = 1
+        return max(number, 1)
+
+    def encode_cursor(self, obj, number, reverse=False):
+        position = {
+            'd': getattr(obj, self.date_field).isoformat(),
+            'pk': obj.pk,
+            'n': number,
+            'r': int(reverse),
+        }
+        raw = json.dumps(position, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            position = json.loads(raw.decode())
+            date = parse_datetime(position['d'])
+            pk, number = int(position['pk']), int(position['n'])
+            reverse = bool(position.get('r'))
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            return None
+        if date is None:
+            return None
+        return date, pk, max(number, 1), reverse
+
+    def fetch(self, position, limit, reverse=False):
+        """Записи строго после `position` (дата, pk) в порядке ленты.
+
+        При `reverse=True` — записи перед ней, от ближних к дальним.
+        """
+        return list(keyset(
+            self.object_list, position, reverse, self.date_field
+        )[:limit])
+
+    def fetch_offset(self, offset, limit):
+        return list(
+            self.object_list.order_by(f'-{self.date_field}', '-pk')
+            [offset:offset + limit]
+        )
+
+    def get_page(self, cursor=None, number=None):
+        """Страница по курсору; без курсора — по номеру через OFFSET.
+
+        Номер страницы оставлен для старых ссылок `?page=N`: уже со второй
+        страницы навигация переходит на курсоры.
+        """
+        position = self.decode_cursor(cursor) if cursor else None
+        if position is None:
+            return self._offset_page(number)
+        date, pk, number, reverse = position
+        rows = self.fetch((date, pk), self.per_page + 1, reverse=reverse)
+        if reverse:
+            if len(rows) <= self.per_page:
+                # Дошли до начала ленты
+                number = 1
+            rows = rows[:self.per_page][::-1]
+            return self._build_page(rows, number, has_next=True)
+        return self._build_page(
+            rows[:self.per_page], number,
+            has_next=len(rows) > self.per_page)
+
+    def _offset_page(self, number):
+        number = self.validate_number(number)
+        if self.with_count:
+            number = min(number, self.num_pages)
+        rows = self.fetch_offset(
+            (number - 1) * self.per_page, self.per_page + 1)
+        return self._build_page(
+            rows[:self.per_page], number,
+            has_next=len(rows) > self.per_page)
+
+    def _build_page(self, rows, number, has_next):
+        self._number = number
+        self._has_next = has_next and bool(rows)
+        page = Page(rows, number, self)
+        page.next_cursor = None
+        page.previous_cursor = None
+        if self._has_next:
+            page.next_cursor = self.encode_cursor(rows[-1], number + 1)
+        if rows and number > 1:
+            page.previous_cursor = self.encode_cursor(
+                rows[0], number - 1, reverse=True)
+        return page
+
+
+def keyset(queryset, position, reverse=False, date_field='pub_date',
+           pk_field='pk'):
+    """Сортирует queryset по (дата, pk) и отсекает всё до `position`."""
+    lookup = 'gt' if reverse else 'lt'
+    if position is not None:
+        date, pk = position
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__{lookup}': date})
+            | Q(**{date_field: date, f'{pk_field}__{lookup}': pk})
+        )
+    if reverse:
+        return queryset.order_by(date_field, pk_field)
+    return queryset.order_by(f'-{date_field}', f'-{pk_field}')
+
+
+def page_query(request, **params):
+    """Строка запроса текущего адреса с заменёнными `params`.
+
+    Остальные параметры (`?q=`, фильтры) сохраняются; параметр
+    со значением None убирается.
+    """
+    query = request.GET.copy()
+    for name, value in params.items():
+        query.pop(name, None)
+        if value is not None:
+            query[name] = value
+    return f'?{query.urlencode()}'
+
+
+def paginate(request, object_list, paginator_class=CursorPaginator,
+             per_page=COUNT_LISTS, **kwargs):
+    """Возвращает страницу ленты по параметрам `?cursor=` или `?page=`.
+
+    К странице добавлены ссылки на соседние страницы first_query,
+    previous_query и next_query с остальными параметрами запроса.
+    """
+    paginator = paginator_class(object_list, per_page, **kwargs)
+    cursor = paginator.cursor_param
+    page = paginator.get_page(
+        request.GET.get(cursor),
+        request.GET.get('page'),
+    )
+    page.first_query = page_query(request, **{cursor: None, 'page': 1})
+    page.previous_query = page_query(
+        request, **{cursor: page.previous_cursor, 'page': None})
+    page.next_query = page_query(
+        request, **{cursor: page.next_cursor, 'page': None})
+    return page
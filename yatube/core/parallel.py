@@ -0,0 +1,52 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, connection
+
+from yatube.settings import QUERY_WORKERS
+
+from .db import pinned, use_primary, use_replicas
+
+_executor = None
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                QUERY_WORKERS, thread_name_prefix='queries')
+    return _executor
+
+
+def _run(call, replica):
+    _local.worker = True
+    close_old_connections()
+    try:
+        with use_replicas() if replica else use_primary():
+            return call()
+    finally:
+        close_old_connections()
+
+
+def gather(*calls):
+    """Выполняет независимые чтения одновременно, результаты —
+    в порядке calls.
+
+    Первое выполняется в текущем потоке, остальные — в пуле из
+    QUERY_WORKERS потоков, каждое через своё соединение с базой и с той
+    же базой для чтения, что и у запроса. По очереди, в текущем потоке,
+    они выполняются без пула (QUERY_WORKERS = 0), внутри транзакции —
+    другие соединения не видят её записей — и внутри самого пула.
+    """
+    if (QUERY_WORKERS < 1 or len(calls) < 2
+            or connection.in_atomic_block
+            or getattr(_local, 'worker', False)):
+        return [call() for call in calls]
+    first, *rest = calls
+    replica = not pinned()
+    futures = [_pool().submit(_run, call, replica) for call in rest]
+    results = [first()]
+    return results + [future.result() for future in futures]
@@ -0,0 +1,208 @@
+import json
+import logging
+import time
+import traceback
+from datetime import timedelta
+from functools import lru_cache, update_wrapper
+
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from yatube.settings import (TASK_BROKER, TASK_LEASE, TASK_MAX_ATTEMPTS,
+                             TASK_RETRY_DELAY, TASK_RETRY_MAX_DELAY)
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class Task:
+    """Функция, которую можно выполнить в фоне: `task.enqueue(*args)`.
+
+    Аргументы сохраняются в JSON. Задача может выполниться повторно
+    (после ошибки или падения воркера), поэтому должна быть
+    идемпотентной. С atomic=False задача выполняется без транзакции:
+    на SQLite транзакция сразу берёт блокировку записи, и долгая задача,
+    которая почти не пишет, держала бы её всё время.
+    """
+
+    def __init__(self, func, max_attempts, atomic):
+        self.func = func
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self.max_attempts = max_attempts
+        self.atomic = atomic
+        update_wrapper(self, func)
+        _registry[self.name] = self
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+    def run(self, args):
+        """Выполняет задачу с аргументами из очереди."""
+        if not self.atomic:
+            return self(*args)
+        # Неудачная попытка не оставляет половины изменений
+        with transaction.atomic():
+            return self(*args)
+
+    def enqueue(self, *args, key=None):
+        """Ставит задачу в очередь. С key задача не ставится, если
+        задача с тем же ключом ещё ждёт выполнения."""
+        broker().enqueue(self, list(args), key)
+
+
+def task(func=None, *, max_attempts=TASK_MAX_ATTEMPTS, atomic=True):
+    """Декоратор фоновой задачи."""
+    if func is None:
+        return lambda func: Task(func, max_attempts, atomic)
+    return Task(func, max_attempts, atomic)
+
+
+class Broker:
+    """Хранилище очереди задач."""
+
+    def enqueue(self, task, args, key):
+        raise NotImplementedError
+
+
+class InlineBroker(Broker):
+    """Выполняет задачу сразу, в текущем потоке: для разработки
+    и тестов, где нет воркеров.
+
+    Аргументы проходят через JSON, как в очереди. Ошибка задачи
+    не прячется в лог, а поднимается: сломанная задача валит тест.
+    """
+
+    def enqueue(self, task, args, key):
+        task.run(json.loads(json.dumps(args)))
+
+
+class DatabaseBroker(Broker):
+    """Очередь в таблице core_job основной базы.
+
+    Задача записывается в той же транзакции, что и изменение, которое
+    её породило: откатилось изменение — откатилась и задача.
+    Выполняет задачи `manage.py run_workers`.
+    """
+
+    def enqueue(self, task, args, key):
+        Job.objects.bulk_create(
+            [Job(
+                name=task.name,
+                args=json.dumps(args),
+                key=key,
+                max_attempts=task.max_attempts,
+            )],
+            # Задача с тем же ключом уже в очереди
+            ignore_conflicts=True,
+        )
+
+
+@lru_cache(maxsize=None)
+def broker():
+    """Очередь из настройки TASK_BROKER."""
+    return import_string(TASK_BROKER)()
+
+
+def backoff(attempts):
+    """Пауза перед следующей попыткой: удваивается с каждой неудачей."""
+    return min(TASK_RETRY_DELAY * 2 ** (attempts - 1), TASK_RETRY_MAX_DELAY)
+
+
+def _retry_or_fail(pk, attempts, max_attempts, error, **conditions):
+    """Откладывает задачу по backoff, а если попытки кончились —
+    помечает FAILED."""
+    updates = {'locked_until': None, 'last_error': error}
+    if attempts >= max_attempts:
+        updates['status'] = Job.FAILED
+    else:
+        updates['run_at'] = timezone.now() + timedelta(
+            seconds=backoff(attempts))
+    Job.objects.filter(pk=pk, **conditions).update(**updates)
+
+
+def expire_leases(now):
+    """Задачи, воркер которых не уложился в TASK_LEASE: упал, убит
+    по памяти или завис. Попытка засчитывается как неудачная."""
+    expired = Job.objects.filter(
+        status=Job.QUEUED, locked_until__lt=now,
+    ).values_list('pk', 'attempts', 'max_attempts', 'locked_until')
+    for pk, attempts, max_attempts, locked_until in expired:
+        _retry_or_fail(
+            pk, attempts, max_attempts,
+            f'Воркер не завершил задачу за {TASK_LEASE} с',
+            # Строку мог уже освободить другой воркер
+            locked_until=locked_until,
+        )
+
+
+def claim():
+    """Занимает готовую задачу на TASK_LEASE секунд; None, если нет.
+
+    Задача занимается условным UPDATE: из воркеров, выбравших одну
+    и ту же строку, его выполнит только один. Задачу упавшего воркера
+    после окончания срока снова ставит в очередь expire_leases.
+    Ключ занятой задачи снимается: изменение, сделанное во время её
+    выполнения, поставит задачу заново.
+    """
+    now = timezone.now()
+    expire_leases(now)
+    candidates = (
+        Job.objects.filter(
+            status=Job.QUEUED, run_at__lte=now, locked_until__isnull=True)
+        .order_by('run_at', 'pk')
+        .values_list('pk', flat=True)[:10]
+    )
+    for pk in candidates:
+        claimed = Job.objects.filter(
+            pk=pk, status=Job.QUEUED, locked_until__isnull=True,
+        ).update(
+            locked_until=now + timedelta(seconds=TASK_LEASE),
+            key=None,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run(job):
+    """Выполняет занятую задачу: удачную удаляет, неудачную
+    откладывает по backoff или, если попытки кончились, помечает
+    FAILED. Возвращает, удалось ли выполнить."""
+    try:
+        task = _registry.get(job.name)
+        if task is None:
+            raise LookupError(f'Неизвестная задача {job.name}')
+        task.run(json.loads(job.args))
+    except Exception:
+        logger.exception('Задача %s не выполнена', job)
+        _retry_or_fail(
+            job.pk, job.attempts, job.max_attempts, traceback.format_exc())
+        return False
+    Job.objects.filter(pk=job.pk).delete()
+    return True
+
+
+def work(stopping, poll_interval=1.0, burst=False):
+    """Цикл воркера: выполняет задачи, пока stopping() ложно.
+
+    Без задач ждёт poll_interval секунд; с burst=True выходит, когда
+    готовых задач не осталось. Возвращает число выполненных задач.
+    """
+    done = 0
+    while not stopping():
+        close_old_connections()
+        job = claim()
+        if job is None:
+            if burst:
+                break
+            time.sleep(poll_interval)
+            continue
+        done += run(job)
+    close_old_connections()
+    return done
@@ -0,0 +1,149 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from posts import urls as posts_urls
+from posts.models import Group
+from posts.seeding import Seeder
+from yatube.settings import (BENCHMARK_COMMENTS, BENCHMARK_FOLLOWS,
+                             BENCHMARK_POSTS, BENCHMARK_REPORT,
+                             BENCHMARK_TIMING, BENCHMARK_USERS)
+
+from .benchmark import measure, write_report
+from .tasks import DatabaseBroker
+
+User = get_user_model()
+
+
+class RouteBudgetTests(TestCase):
+    """Бюджеты запросов и времени ответа для всех адресов сайта.
+
+    Объём данных задаётся YATUBE_BENCHMARK_USERS/POSTS/COMMENTS/FOLLOWS,
+    отчёт пишется в файл из YATUBE_BENCHMARK_REPORT. Бюджет времени
+    проверяется только с YATUBE_BENCHMARK_TIMING=1.
+    """
+
+    # Адрес: (метод, число запросов, миллисекунд). Запросы считаются
+    # для авторизованного клиента с пустым кэшем; фоновые задачи, как
+    # в боевой конфигурации, только ставятся в очередь
+    BUDGETS = {
+        'posts:index': ('get', 3, 500),
+        'posts:group_list': ('get', 4, 500),
+        'posts:profile': ('get', 4, 500),
+        'posts:post_detail': ('get', 5, 500),
+        'posts:search': ('get', 5, 500),
+        'posts:comments': ('get', 4, 300),
+        'posts:post_create': ('get', 5, 300),
+        'posts:post_edit': ('get', 5, 300),
+        'posts:add_comment': ('post', 7, 300),
+        'posts:follow_index': ('get', 4, 500),
+        'posts:profile_follow': ('get', 12, 1000),
+        'posts:profile_unfollow': ('get', 12, 1000),
+        'users:signup': ('get', 2, 300),
+        'users:login': ('get', 2, 300),
+        'users:password_change': ('get', 2, 300),
+        'users:password_change_done': ('get', 2, 300),
+        'users:password_reset': ('get', 2, 300),
+        'users:password_reset_done': ('get', 2, 300),
+        'users:password_reset_confirm': ('get', 3, 300),
+        'users:reset_done': ('get', 2, 300),
+        'about:author': ('get', 2, 300),
+        'about:tech': ('get', 2, 300),
+        'api:posts': ('get', 1, 300),
+        'api:post': ('get', 1, 300),
+        'api:comments': ('get', 2, 300),
+        'api:groups': ('get', 1, 300),
+        'api:group': ('get', 1, 300),
+        'api:user': ('get', 3, 300),
+        'api:follow': ('get', 4, 300),
+        # Выход — последним: после него клиент анонимный
+        'users:logout': ('get', 4, 300),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.volumes = {
+            'users': BENCHMARK_USERS,
+            'posts': BENCHMARK_POSTS,
+            'comments': BENCHMARK_COMMENTS,
+            'follows': BENCHMARK_FOLLOWS,
+        }
+        Seeder(
+            users=BENCHMARK_USERS,
+            groups=10,
+            posts=BENCHMARK_POSTS,
+            comments=BENCHMARK_COMMENTS,
+            follows=BENCHMARK_FOLLOWS,
+        ).run()
+        cls.reader = User.objects.filter(
+            counters__posts_count__gt=0,
+            counters__following_count__gt=0,
+        ).order_by('pk').first()
+        cls.post = cls.reader.posts.latest('pub_date')
+        cls.followed = cls.reader.follower.first().author
+        cls.stranger = User.objects.exclude(
+            pk=cls.reader.pk).exclude(following__user=cls.reader).first()
+        cls.group = Group.objects.first()
+
+    def route_kwargs(self):
+        post = {'post_id': self.post.pk}
+        reset = {'uidb64': 'MQ', 'token': 'set-password'}
+        return {
+            'posts:group_list': {'slug': self.group.slug},
+            'posts:profile': {'username': self.followed.username},
+            'posts:post_detail': post,
+            'posts:comments': post,
+            'posts:post_edit': post,
+            'posts:add_comment': post,
+            'posts:profile_follow': {'username': self.stranger.username},
+            'posts:profile_unfollow': {'username': self.followed.username},
+            'api:post': post,
+            'api:comments': post,
+            'api:group': {'slug': self.group.slug},
+            'api:user': {'username': self.followed.username},
+            'users:password_reset_confirm': reset,
+            'users:reset_done': reset,
+        }
+
+    # Параметры запроса GET: поиск без ?q= не ищет
+    ROUTE_QUERIES = {
+        'posts:search': {'q': 'пост'},
+    }
+
+    @mock.patch('core.tasks.broker', mock.Mock(return_value=DatabaseBroker()))
+    def test_route_budgets(self):
+        self.client.force_login(self.reader)
+        route_kwargs = self.route_kwargs()
+        results = []
+        for name, (method, max_queries, max_ms) in self.BUDGETS.items():
+            url = reverse(name, kwargs=route_kwargs.get(name))
+            if method == 'post':
+                data = {'text': 'Комментарий'}
+            else:
+                data = self.ROUTE_QUERIES.get(name)
+            cache.clear()
+            with measure() as measurement:
+                response = getattr(self.client, method)(url, data)
+            results.append({
+                'name': name,
+                'url': url,
+                'status': response.status_code,
+                **measurement.as_dict(),
+                'max_queries': max_queries,
+                'max_ms': max_ms,
+            })
+            with self.subTest(route=name):
+                self.assertLess(response.status_code, 400)
+                self.assertLessEqual(measurement.queries, max_queries)
+                if BENCHMARK_TIMING:
+                    self.assertLessEqual(measurement.total_ms, max_ms)
+        if BENCHMARK_REPORT:
+            write_report(BENCHMARK_REPORT, self.volumes, results)
+
+    def test_every_posts_route_budgeted(self):
+        names = {
+            f'posts:{pattern.name}' for pattern in posts_urls.urlpatterns}
+        self.assertEqual(names - self.BUDGETS.keys(), set())
@@ -1,9 +1,620 @@
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from datetime import timedelta
 from http import HTTPStatus
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+
+from posts.models import Post
+from yatube.settings import REPLICA_STICKY_SECONDS, TASK_RETRY_DELAY
+
+from .asgi import AsgiHandler
+from .backends.sqlite3.base import DatabaseWrapper, write_lock
+from .benchmark import mixed_load
+from .cache import (Compressed, CompressedLocMemCache, SQLiteCache,
+                    TieredCache, _Tier, cache_config)
+from .db import (SQLITE_PROFILES, STICKY_COOKIE, ReplicaMiddleware,
+                 ReplicaRouter, database_config, pinned, primary,
+                 use_replicas)
+from .models import Job
+from .parallel import gather
+from .tasks import DatabaseBroker, InlineBroker, backoff, claim, task, work
+
+calls = []
+
+
+@task
+def record(value):
+    calls.append(value)
+
+
+@task(max_attempts=2)
+def broken():
+    raise ValueError('Сломано')
 
 
 class ViewTestClass(TestCase):
     def test_error_page(self):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class CacheConfigTests(SimpleTestCase):
+    def test_app_aliases_share_location(self):
+        config = cache_config(
+            'memcached://10.0.0.1:11211,10.0.0.2:11211',
+            key_prefix='yatube', apps=['posts'])
+        self.assertEqual(
+            config['posts']['LOCATION'], ['10.0.0.1:11211', '10.0.0.2:11211'])
+        self.assertEqual(
+            config['posts']['LOCATION'], config['default']['LOCATION'])
+        self.assertEqual(config['posts']['KEY_PREFIX'], 'yatube:posts')
+
+    def test_sqlite_location_is_path(self):
+        config = cache_config('sqlite:///var/cache/yatube.sqlite3')
+        self.assertEqual(
+            config['default']['LOCATION'], '/var/cache/yatube.sqlite3')
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            cache_config('redis://localhost')
+
+    def test_file_cache_rejected_for_apps(self):
+        cache_config('file:///var/cache/yatube')
+        with self.assertRaisesMessage(ValueError, 'posts'):
+            cache_config('file:///var/cache/yatube', apps=['posts'])
+
+
+class DatabaseConfigTests(SimpleTestCase):
+    def test_replicas_mirror_default_in_tests(self):
+        config = database_config(
+            'sqlite:///var/lib/yatube/db.sqlite3',
+            replicas=['sqlite:///var/lib/yatube/replica.sqlite3'],
+            conn_max_age=60,
+        )
+        self.assertEqual(
+            config['default']['NAME'], '/var/lib/yatube/db.sqlite3')
+        self.assertEqual(config['replica_1']['TEST'], {'MIRROR': 'default'})
+        self.assertEqual(config['replica_1']['CONN_MAX_AGE'], 60)
+
+    def test_postgres_url(self):
+        config = database_config('postgres://yatube:p%40ss@db:5433/yatube')
+        self.assertEqual(config['default'], {
+            'ENGINE': 'django.db.backends.postgresql',
+            'CONN_MAX_AGE': 0,
+            'NAME': 'yatube',
+            'USER': 'yatube',
+            'PASSWORD': 'p@ss',
+            'HOST': 'db',
+            'PORT': '5433',
+        })
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            database_config('oracle://db/yatube')
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.router.replicas = ['replica_1', 'replica_2']
+
+    def test_reads_go_to_replicas_writes_to_primary(self):
+        with use_replicas():
+            self.assertIn(
+                self.router.db_for_read(Post), self.router.replicas)
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+        self.assertFalse(self.router.allow_migrate('replica_1', 'posts'))
+
+    def test_write_views_read_from_primary(self):
+        @primary
+        def view():
+            return self.router.db_for_read(Post)
+
+        with use_replicas():
+            self.assertEqual(view(), 'default')
+            self.assertFalse(pinned())
+
+    def test_outside_requests_read_from_primary(self):
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def request(self, get_response, method='get', cookies=None):
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaMiddleware(get_response)(request)
+
+    def test_client_sticks_to_primary_after_write(self):
+        reads = []
+
+        def write(request):
+            self.router.db_for_write(Post)
+            return HttpResponse()
+
+        def read(request):
+            reads.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        self.request(read)
+        response = self.request(write)
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], REPLICA_STICKY_SECONDS)
+        self.request(read, cookies={STICKY_COOKIE: cookie.value})
+        self.assertIn(reads[0], self.router.replicas)
+        self.assertEqual(reads[1], 'default')
+
+    def test_session_writes_do_not_stick(self):
+        def save_session(request):
+            self.router.db_for_write(Session)
+            return HttpResponse()
+
+        response = self.request(save_session)
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_unsafe_methods_use_primary(self):
+        def view(request):
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+            return HttpResponse()
+
+        self.request(view, method='post')
+
+
+class SQLiteTuningTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'db.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def wrapper(self, **options):
+        settings_dict = dict(
+            connection.settings_dict, NAME=self.path, **options)
+        wrapper = DatabaseWrapper(settings_dict, alias='tuning')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            return cursor.execute(f'PRAGMA {name}').fetchone()[0]
+
+    def test_tuned_profile_pragmas(self):
+        wrapper = self.wrapper(**SQLITE_PROFILES['tuned'])
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 10000)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -65536)
+
+    def test_write_queue_released_after_transaction(self):
+        wrapper = self.wrapper(
+            TRANSACTION_MODE='IMMEDIATE', WRITE_QUEUE=True)
+        lock = write_lock(self.path)
+        wrapper.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True)
+        self.assertTrue(lock.locked())
+        self.assertTrue(wrapper.connection.in_transaction)
+        wrapper.commit()
+        wrapper.set_autocommit(True)
+        self.assertFalse(lock.locked())
+        wrapper.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True)
+        wrapper.rollback()
+        self.assertFalse(lock.locked())
+
+    def test_mixed_load_counts_operations(self):
+        result = mixed_load(
+            read=lambda chooser: None,
+            write=lambda chooser: None,
+            threads=2,
+            seconds=0.05,
+            write_ratio=0.5,
+        ).as_dict()
+        self.assertGreater(result['read']['ops'], 0)
+        self.assertGreater(result['write']['ops'], 0)
+        self.assertEqual(result['write']['errors'], 0)
+
+
+class CompressionTests(SimpleTestCase):
+    def test_large_values_are_compressed(self):
+        cache = CompressedLocMemCache(
+            'compression-test', {'COMPRESS_MIN_LENGTH': 100})
+        cache.set('big', 'x' * 1000)
+        cache.set('small', 'x')
+        raw = cache._cache[cache.make_key('big')]
+        self.assertLess(len(raw), 1000)
+        self.assertEqual(cache.get('big'), 'x' * 1000)
+        self.assertEqual(
+            cache.get_many(['big', 'small']),
+            {'big': 'x' * 1000, 'small': 'x'})
+        self.assertNotIsInstance(cache.get('small'), Compressed)
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = SQLiteCache(
+            os.path.join(self.directory, 'cache.sqlite3'),
+            {'COMPRESS_MIN_LENGTH': 100, 'KEY_PREFIX': 'test'})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_set_get_delete(self):
+        self.cache.set('key', {'a': 1})
+        self.assertEqual(self.cache.get('key'), {'a': 1})
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_add_and_incr(self):
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 5))
+        self.assertEqual(self.cache.incr('counter'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_many_and_compression(self):
+        self.cache.set_many({'big': 'y' * 1000, 'small': 'y'})
+        self.assertEqual(
+            self.cache.get_many(['big', 'small', 'missing']),
+            {'big': 'y' * 1000, 'small': 'y'})
+
+    def test_expired_values_are_missing(self):
+        self.cache.set('old', 1, timeout=-1)
+        self.assertFalse(self.cache.has_key('old'))
+        self.assertTrue(self.cache.add('old', 2))
+
+    def test_shared_between_instances(self):
+        other = SQLiteCache(self.cache._path, {'KEY_PREFIX': 'test'})
+        self.cache.set('shared', 'значение')
+        self.assertEqual(other.get('shared'), 'значение')
+
+
+class TieredCacheTests(SimpleTestCase):
+    params = {
+        'KEY_PREFIX': 'tier-test',
+        'OPTIONS': {'MAX_ENTRIES': 2},
+        'L1_TIMEOUT': 60,
+        'SYNC_INTERVAL': 0,
+    }
+
+    def setUp(self):
+        self.cache = TieredCache('posts', self.params)
+        self.cache._tier = _Tier()
+        self.cache.stats = self.cache._tier.stats
+        self.cache.clear()
+
+    def worker(self):
+        # Второй воркер: тот же L2, но собственный L1
+        other = TieredCache('posts', self.params)
+        other._tier = _Tier()
+        other.stats = other._tier.stats
+        return other
+
+    def test_second_read_is_l1_hit(self):
+        self.assertIsNone(self.cache.get('group'))
+        self.cache.set('group', 'Котики')
+        self.cache.l2.set('group', 'мимо L1', version=None)
+        self.assertEqual(self.cache.get('group'), 'Котики')
+        self.assertEqual(self.cache.stats['l1']['hits'], 1)
+        self.assertEqual(self.cache.stats['l2']['misses'], 1)
+
+    def test_l2_fills_l1_and_lru_evicts(self):
+        other = self.worker()
+        other.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(other.stats['l1']['evictions'], 1)
+        self.assertEqual(self.cache.get_many(['a', 'b']), {'a': 1, 'b': 2})
+        self.assertEqual(self.cache.stats['l2']['hits'], 2)
+        self.cache.get('a')
+        self.assertEqual(self.cache.stats['l1']['hits'], 1)
+
+    def test_write_on_other_worker_evicts_l1(self):
+        self.cache.set('post', 'старый текст')
+        self.cache.get('post')
+        other = self.worker()
+        other.get('post')
+        other.set('post', 'новый текст')
+        self.assertEqual(self.cache.get('post'), 'новый текст')
+        other.delete('post')
+        self.assertIsNone(self.cache.get('post'))
+
+
+class CacheStatsViewTests(TestCase):
+    def test_only_staff(self):
+        response = self.client.get('/cache-stats/')
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        admin = get_user_model().objects.create_user(
+            username='admin', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.get('/cache-stats/')
+        self.assertIn('caches', response.json())
+
+
+class GatherTests(SimpleTestCase):
+    def test_runs_inline_without_workers(self):
+        with mock.patch('core.parallel.QUERY_WORKERS', 0):
+            threads = gather(
+                threading.get_ident, threading.get_ident)
+        self.assertEqual(set(threads), {threading.get_ident()})
+
+    def test_runs_concurrently_with_replica_state(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        def read():
+            # Все три чтения должны идти одновременно
+            barrier.wait()
+            return pinned()
+
+        with mock.patch('core.parallel.QUERY_WORKERS', 2):
+            with use_replicas():
+                self.assertEqual(gather(read, read, read), [False] * 3)
+            self.assertEqual(gather(lambda: 1, pinned), [1, True])
+
+
+class AsgiHandlerTests(SimpleTestCase):
+    def request(self, application, **scope):
+        messages = []
+        body = [
+            {'type': 'http.request', 'body': b'te', 'more_body': True},
+            {'type': 'http.request', 'body': b'xt'},
+        ]
+
+        async def receive():
+            return body.pop(0)
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(application(
+            {
+                'type': 'http',
+                'method': 'POST',
+                'path': '/путь/',
+                'query_string': b'a=1',
+                'headers': [
+                    (b'content-type', b'text/plain'),
+                    (b'x-test', b'1'),
+                    (b'x-test', b'2'),
+                ],
+                **scope,
+            },
+            receive,
+            send,
+        ))
+        return messages
+
+    def test_request_runs_wsgi_application(self):
+        seen = {}
+
+        def wsgi(environ, start_response):
+            seen.update(environ)
+            seen['body'] = environ['wsgi.input'].read()
+            seen['thread'] = threading.get_ident()
+            start_response('201 Created', [('Content-Type', 'text/plain')])
+            return [b'o', b'k']
+
+        messages = self.request(AsgiHandler(wsgi, threads=2))
+        self.assertEqual(seen['body'], b'text')
+        self.assertEqual(
+            seen['PATH_INFO'].encode('latin-1').decode(), '/путь/')
+        self.assertEqual(seen['QUERY_STRING'], 'a=1')
+        self.assertEqual(seen['CONTENT_TYPE'], 'text/plain')
+        self.assertEqual(seen['HTTP_X_TEST'], '1,2')
+        self.assertNotEqual(seen['thread'], threading.get_ident())
+        self.assertEqual(messages[0]['status'], 201)
+        self.assertEqual(
+            messages[0]['headers'], [(b'content-type', b'text/plain')])
+        self.assertEqual(
+            [(message['body'], message['more_body'])
+             for message in messages[1:]],
+            [(b'o', True), (b'k', True), (b'', False)])
+
+    def test_response_streamed_in_chunks(self):
+        first_sent = threading.Event()
+        closed = []
+
+        class Stream:
+            def __iter__(self):
+                yield b'first'
+                # Первая часть ушла клиенту раньше, чем готова вторая
+                if first_sent.wait(timeout=5):
+                    yield b'second'
+
+            def close(self):
+                closed.append(threading.get_ident())
+
+        def wsgi(environ, start_response):
+            start_response('200 OK', [])
+            return Stream()
+
+        handler = AsgiHandler(wsgi, threads=2)
+        sent = []
+
+        async def send(message):
+            sent.append(message.get('body'))
+            if message.get('body') == b'first':
+                first_sent.set()
+
+        async def receive():
+            return {'type': 'http.request'}
+
+        asyncio.run(handler(
+            {'type': 'http', 'method': 'GET', 'path': '/'}, receive, send))
+        self.assertEqual(sent, [None, b'first', b'second', b''])
+        # Ответ закрыт один раз, в потоке пула
+        self.assertEqual(len(closed), 1)
+        self.assertNotEqual(closed[0], threading.get_ident())
+
+    def test_shutdown_waits_for_streaming_response(self):
+        def wsgi(environ, start_response):
+            start_response('200 OK', [])
+            # Больше частей, чем помещается в очередь отправки
+            return [b'x'] * 50
+
+        handler = AsgiHandler(wsgi, threads=1)
+        sent = []
+
+        async def main():
+            client_ready = asyncio.Event()
+            lifespan = [
+                {'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+
+            async def send(message):
+                # Медленный клиент: ответ дописывается уже во время остановки
+                await client_ready.wait()
+                sent.append(message)
+
+            async def receive():
+                return {'type': 'http.request'}
+
+            async def lifespan_receive():
+                return lifespan.pop(0)
+
+            async def lifespan_send(message):
+                sent.append(message)
+
+            request = asyncio.ensure_future(handler(
+                {'type': 'http', 'method': 'GET', 'path': '/'},
+                receive, send))
+            await asyncio.sleep(0.05)
+            shutdown = asyncio.ensure_future(handler(
+                {'type': 'lifespan'}, lifespan_receive, lifespan_send))
+            await asyncio.sleep(0.05)
+            client_ready.set()
+            await asyncio.wait_for(asyncio.gather(request, shutdown), 5)
+
+        asyncio.run(main())
+        self.assertEqual(sent[-1], {'type': 'lifespan.shutdown.complete'})
+        self.assertEqual(
+            sum(message.get('body') == b'x' for message in sent), 50)
+
+    def test_exc_info_replaces_unsent_headers(self):
+        def wsgi(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            try:
+                raise ValueError('Сломано')
+            except ValueError:
+                start_response('500 Internal Server Error', [],
+                               sys.exc_info())
+            return [b'error']
+
+        messages = self.request(AsgiHandler(wsgi, threads=1))
+        self.assertEqual(messages[0]['status'], 500)
+        self.assertEqual(messages[0]['headers'], [])
+
+    def test_exc_info_after_headers_raised(self):
+        def wsgi(environ, start_response):
+            start_response('200 OK', [])
+            yield b'part'
+            try:
+                raise ValueError('Сломано')
+            except ValueError:
+                start_response('500 Internal Server Error', [],
+                               sys.exc_info())
+
+        with self.assertRaisesMessage(ValueError, 'Сломано'):
+            self.request(AsgiHandler(wsgi, threads=1))
+
+
+@mock.patch('core.tasks.close_old_connections', mock.Mock())
+@mock.patch('core.tasks.broker', mock.Mock(return_value=DatabaseBroker()))
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def work(self):
+        return work(lambda: False, burst=True)
+
+    def test_worker_runs_and_deletes_job(self):
+        record.enqueue({'id': 1})
+        self.assertEqual(calls, [])
+        self.assertEqual(self.work(), 1)
+        self.assertEqual(calls, [{'id': 1}])
+        self.assertFalse(Job.objects.exists())
+
+    def test_key_deduplicates_waiting_jobs(self):
+        record.enqueue(1, key='record:1')
+        record.enqueue(1, key='record:1')
+        record.enqueue(2)
+        record.enqueue(2)
+        self.assertEqual(Job.objects.count(), 3)
+        # Занятая задача может не увидеть новых изменений: ставим заново
+        claim()
+        record.enqueue(1, key='record:1')
+        self.assertEqual(Job.objects.filter(name=record.name).count(), 4)
+
+    def test_failed_job_retried_with_backoff(self):
+        self.assertEqual(backoff(1), TASK_RETRY_DELAY)
+        self.assertEqual(backoff(3), TASK_RETRY_DELAY * 4)
+        broken.enqueue()
+        self.assertEqual(self.work(), 0)
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('Сломано', job.last_error)
+        delay = timedelta(seconds=TASK_RETRY_DELAY - 1)
+        self.assertGreater(job.run_at, timezone.now() + delay)
+        # Пауза ещё не прошла
+        self.assertEqual(self.work(), 0)
+        self.assertEqual(Job.objects.get().attempts, 1)
+        Job.objects.update(run_at=timezone.now())
+        self.work()
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+        Job.objects.update(run_at=timezone.now())
+        self.assertIsNone(claim())
+
+    def expire_lease(self):
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+
+    def test_expired_lease_retried_with_backoff(self):
+        broken.enqueue()
+        self.assertEqual(claim().attempts, 1)
+        self.assertIsNone(claim())
+        # Воркер упал: задача ждёт паузу, как после ошибки
+        self.expire_lease()
+        self.assertIsNone(claim())
+        job = Job.objects.get()
+        self.assertIsNone(job.locked_until)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('не завершил', job.last_error)
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(claim().attempts, 2)
+        # Попытки кончились — задача больше не выполняется
+        self.expire_lease()
+        self.assertIsNone(claim())
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+    def test_run_workers_command(self):
+        record.enqueue(1)
+        out = StringIO()
+        call_command('run_workers', processes=1, burst=True, stdout=out)
+        self.assertIn('Выполнено задач: 1', out.getvalue())
+        self.assertEqual(calls, [1])
+
+
+class InlineBrokerTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_runs_task_at_once(self):
+        InlineBroker().enqueue(record, [(1, 2)], key=None)
+        # Аргументы проходят через JSON, как в очереди
+        self.assertEqual(calls, [[1, 2]])
+        self.assertFalse(Job.objects.exists())
+
+    def test_error_is_raised(self):
+        with self.assertRaisesMessage(ValueError, 'Сломано'):
+            InlineBroker().enqueue(broken, [], key=None)
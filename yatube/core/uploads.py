@@ -0,0 +1,27 @@
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+from yatube.settings import UPLOAD_MAX_SIZE
+
+
+class SizeLimitedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузки сразу во временный файл, не держа их в памяти.
+
+    После UPLOAD_MAX_SIZE байт файл дальше не пишется: остаток запроса
+    вычитывается и отбрасывается, а у файла выставляется `truncated`,
+    чтобы форма могла сообщить о превышении размера.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > UPLOAD_MAX_SIZE:
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(min(file_size, UPLOAD_MAX_SIZE))
+        file.truncated = self.received > UPLOAD_MAX_SIZE
+        return file
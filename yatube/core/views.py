@@ -1,6 +1,12 @@
 # core/views.py
+import os
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.shortcuts import render
 
+from .cache import tier_stats
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -22,3 +28,9 @@ def server_error(request):
 
 def bad_request(request, exception):
     return render(request, 'core/400.html', status=400)
+
+
+@staff_member_required
+def cache_stats(request):
+    """Попадания, промахи и вытеснения двухуровневого кэша воркера."""
+    return JsonResponse({'pid': os.getpid(), 'caches': tier_stats()})
@@ -0,0 +1,81 @@
+import time
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from yatube.settings import IMAGE_GC_GRACE
+
+from .models import ImageBlob, Post
+
+storage = Post._meta.get_field('image').storage
+
+
+def attach(name):
+    """Учитывает новую ссылку поста на файл."""
+    if ImageBlob.objects.filter(name=name).update(
+            references=F('references') + 1):
+        return
+    try:
+        with transaction.atomic():
+            ImageBlob.objects.create(name=name, references=1)
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        ImageBlob.objects.filter(name=name).update(
+            references=F('references') + 1)
+
+
+def release(name):
+    """Снимает ссылку на файл; файл без ссылок удаляется после коммита."""
+    ImageBlob.objects.filter(name=name, references__gte=1).update(
+        references=F('references') - 1)
+    transaction.on_commit(lambda: collect([name]))
+
+
+def collect(names=None):
+    """Удаляет файлы без ссылок вместе с миниатюрами.
+
+    Файлы, которые переиспользовали последние IMAGE_GC_GRACE секунд,
+    не трогаем: на них вот-вот появится ссылка. Их подберёт следующий
+    запуск `manage.py collect_images`. Возвращает число удалённых файлов.
+    """
+    orphans = ImageBlob.objects.filter(references=0)
+    if names is not None:
+        orphans = orphans.filter(name__in=names)
+    deadline = time.time() - IMAGE_GC_GRACE
+    collected = 0
+    for name in orphans.values_list('name', flat=True):
+        if (storage.exists(name)
+                and storage.get_modified_time(name).timestamp() > deadline):
+            continue
+        if not ImageBlob.objects.filter(name=name, references=0).delete()[0]:
+            continue
+        # Записи и файлы миниатюр sorl, затем сам файл
+        default.kvstore.delete(ImageFile(name, storage))
+        storage.delete(name)
+        collected += 1
+    return collected
+
+
+def repair():
+    """Пересчитывает ссылки по таблице постов. Возвращает число исправлений."""
+    actual = dict(
+        Post.objects.exclude(image='')
+        .values_list('image').annotate(total=Count('pk')).order_by()
+    )
+    repaired = 0
+    for blob in ImageBlob.objects.iterator():
+        references = actual.pop(blob.name, 0)
+        if blob.references != references:
+            ImageBlob.objects.filter(name=blob.name).update(
+                references=references)
+            repaired += 1
+    ImageBlob.objects.bulk_create(
+        [
+            ImageBlob(name=name, references=references)
+            for name, references in actual.items()
+        ],
+        batch_size=500,
+    )
+    return repaired + len(actual)
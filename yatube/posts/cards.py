@@ -0,0 +1,78 @@
+import time
+
+from core.cache import app_cache
+from yatube.settings import REPLICA_STICKY_SECONDS
+
+cache = app_cache('posts')
+
+VERSION_KEY = 'card_version:{kind}:{pk}'
+CHANGED_KEY = 'changed:{key}'
+
+
+def _new_version():
+    # Начальная версия от времени: после вытеснения ключа из кэша
+    # новая версия не совпадёт ни с одной из прежних
+    return int(time.time() * 1000)
+
+
+def mark_changed(keys):
+    """Отмечает версии по ключам keys как только что изменённые.
+
+    Метка живёт REPLICA_STICKY_SECONDS и ставится до смены версии:
+    кто увидел новую версию, увидит и метку.
+    """
+    cache.set_many(
+        {CHANGED_KEY.format(key=key): 1 for key in keys},
+        REPLICA_STICKY_SECONDS)
+
+
+def changed_recently(keys):
+    """Менялась ли какая-то из версий за REPLICA_STICKY_SECONDS: пока
+    реплики догоняют запись, данные под новой версией, которые лягут
+    в кэш, надо читать с основной базы."""
+    return bool(cache.get_many(
+        [CHANGED_KEY.format(key=key) for key in keys]))
+
+
+def bump(kind, pk):
+    """Делает недействительными карточки, зависящие от объекта."""
+    key = VERSION_KEY.format(kind=kind, pk=pk)
+    mark_changed([key])
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+
+
+def get_versions(keys):
+    """Текущие версии по ключам VERSION_KEY одним get_many."""
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in set(keys) - versions.keys()}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return versions
+
+
+def card_keys(post):
+    """Ключи версий карточки поста: сам пост, его группа и автор."""
+    return [
+        VERSION_KEY.format(kind='post', pk=post.pk),
+        VERSION_KEY.format(kind='group', pk=post.group_id),
+        VERSION_KEY.format(kind='user', pk=post.author_id),
+    ]
+
+
+def with_card_versions(posts):
+    """Проставляет постам `card_version` для ключа `{% cache %}`.
+
+    Версия собирается из версий поста, группы и автора одним get_many.
+    """
+    posts = list(posts)
+    keys = {post.pk: card_keys(post) for post in posts}
+    versions = get_versions(
+        {key for post_keys in keys.values() for key in post_keys})
+    for post in posts:
+        post.card_version = '.'.join(
+            str(versions[key]) for key in keys[post.pk])
+    return posts
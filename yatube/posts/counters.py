@@ -0,0 +1,104 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, UserCounter
+
+User = get_user_model()
+
+
+def _total(queryset, field):
+    """Подзапрос с числом строк queryset для OuterRef('pk')."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0)
+    )
+
+
+def actual_user_counts():
+    """Пользователи с пересчитанными по таблицам значениями счётчиков."""
+    return User.objects.annotate(
+        actual_posts=_total(Post.objects, 'author'),
+        actual_followers=_total(Follow.objects, 'author'),
+        actual_following=_total(Follow.objects, 'user'),
+    )
+
+
+def get_counters(user):
+    """Счётчики пользователя для страницы.
+
+    Строку счётчиков создаёт сигнал при регистрации. Если её всё же
+    нет, страница показывает нули и ничего не пишет: запрос на чтение
+    не должен брать блокировку записи и уходить на основную базу.
+    Строку создаст `manage.py repair_counters`.
+    """
+    try:
+        return user.counters
+    except UserCounter.DoesNotExist:
+        return UserCounter(user=user)
+
+
+def change_user(user_id, **deltas):
+    """Сдвигает счётчики пользователя на `deltas` одним UPDATE.
+
+    Если строки счётчиков нет, её посчитает с нуля `repair_users`.
+    """
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    # Счётчики беззнаковые: не уводим в минус уже разошедшуюся строку
+    floor = {
+        f'{field}__gte': -delta
+        for field, delta in deltas.items() if delta < 0
+    }
+    UserCounter.objects.filter(user_id=user_id, **floor).update(**updates)
+
+
+def change_post(post_id, delta):
+    floor = {'comments_count__gte': -delta} if delta < 0 else {}
+    Post.objects.filter(pk=post_id, **floor).update(
+        comments_count=F('comments_count') + delta)
+
+
+def repair_users():
+    """Создаёт недостающие и исправляет разошедшиеся счётчики.
+
+    Возвращает число исправленных пользователей.
+    """
+    UserCounter.objects.bulk_create(
+        [
+            UserCounter(user_id=user_id)
+            for user_id in User.objects.filter(
+                counters__isnull=True).values_list('pk', flat=True)
+        ],
+        batch_size=500,
+    )
+    drifted = actual_user_counts().filter(
+        ~Q(counters__posts_count=F('actual_posts'))
+        | ~Q(counters__followers_count=F('actual_followers'))
+        | ~Q(counters__following_count=F('actual_following'))
+    )
+    repaired = 0
+    for user in drifted.iterator():
+        UserCounter.objects.filter(user_id=user.pk).update(
+            posts_count=user.actual_posts,
+            followers_count=user.actual_followers,
+            following_count=user.actual_following,
+        )
+        repaired += 1
+    return repaired
+
+
+def repair_posts():
+    actual = _total(Comment.objects, 'post')
+    drifted = Post.objects.annotate(actual=actual).exclude(
+        comments_count=F('actual'))
+    repaired = 0
+    for post_id, comments in drifted.values_list('pk', 'actual').iterator():
+        Post.objects.filter(pk=post_id).update(comments_count=comments)
+        repaired += 1
+    return repaired
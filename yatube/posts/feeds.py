@@ -0,0 +1,47 @@
+from .models import Group, Post
+
+# Поля, которые читает карточка поста в лентах
+CARD_FIELDS = (
+    'id',
+    'text',
+    'pub_date',
+    'image',
+    'group_id',
+    'group__slug',
+    'author_id',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+)
+
+
+def feed(**filters):
+    """Посты для ленты: автор и группа одним JOIN, только поля карточки."""
+    return (
+        Post.objects.filter(**filters)
+        .select_related('author', 'group')
+        .only(*CARD_FIELDS)
+    )
+
+
+def group_feeds(group_ids):
+    slugs = Group.objects.filter(
+        pk__in=set(group_ids) - {None}).values_list('slug', flat=True)
+    return [f'group:{slug}' for slug in slugs]
+
+
+def post_feeds(post):
+    """Ленты, в которых показан пост до и после изменения."""
+    return [
+        'index',
+        f'profile:{post.author.username}',
+        *group_feeds({post.group_id, post._original_group_id}),
+    ]
+
+
+def author_feeds(usernames, posts):
+    return [
+        'index',
+        *(f'profile:{username}' for username in usernames),
+        *group_feeds(posts.values_list('group_id', flat=True).distinct()),
+    ]
@@ -1,6 +1,15 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+
+from yatube.settings import POST_IMAGE_MAX_PIXELS, UPLOAD_MAX_SIZE
 
 from .models import Comment, Post
+from .uploads import SAVE_AS, frame_count, reencode
+
+# Ошибки Pillow при декодировании повреждённой или обрезанной картинки
+DECODE_ERRORS = (OSError, SyntaxError, Image.DecompressionBombError)
+SIZE_ERROR = f'Файл больше {UPLOAD_MAX_SIZE // 2 ** 20} МБ'
 
 
 class PostForm(forms.ModelForm):
@@ -8,6 +17,40 @@ class PostForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         self.fields['group'].empty_label = 'Группа не выбрана'
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if not isinstance(image, UploadedFile):
+            # Картинку не меняли
+            return image
+        if getattr(image, 'truncated', False):
+            # Заголовок дошёл целиком, а пиксели обрезаны
+            raise forms.ValidationError(SIZE_ERROR)
+        # Размеры и формат ImageField прочитал из заголовка,
+        # сами пиксели ещё не декодированы
+        if image.image.format not in SAVE_AS:
+            raise forms.ValidationError(
+                'Загрузите картинку в формате JPEG, PNG, GIF или WebP')
+        width, height = image.image.size
+        try:
+            # Кадры анимации декодируются все
+            if width * height * frame_count(image) > POST_IMAGE_MAX_PIXELS:
+                raise forms.ValidationError(
+                    f'Картинка больше {POST_IMAGE_MAX_PIXELS // 10 ** 6} Мп')
+            return reencode(image)
+        except DECODE_ERRORS:
+            raise forms.ValidationError(
+                'Файл повреждён: загрузите картинку заново')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        image = self.files.get('image')
+        if getattr(image, 'truncated', False):
+            # Обрезанный файл ImageField отверг как повреждённый —
+            # сообщаем настоящую причину
+            self.errors.pop('image', None)
+            self.add_error('image', SIZE_ERROR)
+        return cleaned_data
+
     class Meta:
         model = Post
         fields = ['text', 'group', 'image']
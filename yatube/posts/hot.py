@@ -0,0 +1,105 @@
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.http import Http404
+
+from core.cache import app_cache
+from core.db import use_primary
+
+from .models import Group, Post
+
+User = get_user_model()
+cache = app_cache('hot')
+
+HOT_TIMEOUT = 60 * 5
+# Общий кэш могут читать другие серверы, а то и люди: хэш пароля,
+# почта и права пользователя туда не попадают
+AUTHOR_FIELDS = ('id', 'username', 'first_name', 'last_name')
+
+
+def _slug_key(slug):
+    # Длинный или кириллический slug не годится в ключ memcached
+    return 'group_slug:' + hashlib.md5(slug.encode()).hexdigest()
+
+
+def _load_author(pk):
+    return User.objects.only(*AUTHOR_FIELDS).filter(pk=pk).first()
+
+
+def _get_or_load(key, load):
+    value = cache.get(key)
+    if value is None:
+        # В кэш — только свежие строки основной базы, не отстающей реплики
+        with use_primary():
+            value = load()
+        if value is not None:
+            cache.set(key, value, HOT_TIMEOUT)
+    return value
+
+
+def get_group(slug):
+    group = _get_or_load(
+        _slug_key(slug), Group.objects.filter(slug=slug).first)
+    if group is None:
+        raise Http404('Группа не найдена')
+    return group
+
+
+def _load_post(pk):
+    """Пост, его автор и группа одним запросом.
+
+    Автор и группа кладутся в кэш своими ключами, а пост — без них.
+    У автора читаются только AUTHOR_FIELDS.
+    """
+    post = Post.objects.select_related('author', 'group').only(
+        *(field.name for field in Post._meta.concrete_fields),
+        *(f'author__{name}' for name in AUTHOR_FIELDS),
+    ).filter(pk=pk).first()
+    if post is None:
+        return None
+    related = {f'user:{post.author_id}': post.author}
+    if post.group_id is not None:
+        related[f'group:{post.group_id}'] = post.group
+    cache.set_many(related, HOT_TIMEOUT)
+    for name in ('author', 'group'):
+        Post._meta.get_field(name).delete_cached_value(post)
+    return post
+
+
+def get_post(pk):
+    """Пост с автором и группой из кэша горячих объектов.
+
+    Строки поста, автора и группы кэшируются по отдельности, чтобы
+    правка автора или группы не требовала искать все их посты.
+    """
+    post = _get_or_load(f'post:{pk}', lambda: _load_post(pk))
+    if post is None:
+        raise Http404('Пост не найден')
+    keys = {f'user:{post.author_id}': post.author_id}
+    if post.group_id is not None:
+        keys[f'group:{post.group_id}'] = post.group_id
+    related = cache.get_many(keys)
+    if f'user:{post.author_id}' not in related:
+        related[f'user:{post.author_id}'] = _get_or_load(
+            f'user:{post.author_id}', lambda: _load_author(post.author_id))
+    if post.group_id is not None and f'group:{post.group_id}' not in related:
+        related[f'group:{post.group_id}'] = _get_or_load(
+            f'group:{post.group_id}',
+            Group.objects.filter(pk=post.group_id).first)
+    post.author = related[f'user:{post.author_id}']
+    if post.group_id is not None:
+        post.group = related[f'group:{post.group_id}']
+    return post
+
+
+def forget_post(post_id):
+    cache.delete(f'post:{post_id}')
+
+
+def forget_group(group, *slugs):
+    cache.delete_many(
+        [f'group:{group.pk}', *(_slug_key(slug) for slug in slugs)])
+
+
+def forget_user(user):
+    cache.delete(f'user:{user.pk}')
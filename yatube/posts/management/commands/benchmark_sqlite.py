@@ -0,0 +1,83 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.benchmark import mixed_load
+from posts.feeds import feed
+from posts.models import Comment, Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Смешанная нагрузка на базу: чтение лент и комментарии '
+            'из нескольких потоков. Пишет в базу — запускайте на копии '
+            'с данными seed_yatube, профиль задаётся YATUBE_SQLITE_PROFILE')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help='Потоков в каждом процессе')
+        parser.add_argument('--seconds', type=float, default=10.0)
+        parser.add_argument(
+            '--write-ratio', type=float, default=0.2,
+            help='Доля записей среди операций, от 0 до 1')
+        parser.add_argument(
+            '--report', help='Файл для JSON-отчёта')
+
+    def handle(self, *args, **options):
+        first, last = (
+            Post.objects.order_by('pk').values_list('pk', flat=True).first(),
+            Post.objects.order_by('-pk').values_list('pk', flat=True).first(),
+        )
+        users = list(User.objects.values_list('pk', flat=True)[:1000])
+        if first is None or not users:
+            raise CommandError('База пуста: сначала seed_yatube')
+        # Посты с началом ленты: их и комментируют чаще всего
+        recent = max(first, last - 1000)
+
+        def read(chooser):
+            list(feed()[:10])
+            post = chooser.randint(recent, last)
+            list(Comment.objects.filter(post=post).select_related(
+                'author').order_by('-created')[:20])
+
+        def write(chooser):
+            # Как add_comment: транзакция сначала читает пост, потом пишет
+            with transaction.atomic():
+                post = Post.objects.only('pk').get(
+                    pk=chooser.randint(recent, last))
+                Comment.objects.create(
+                    post=post,
+                    author_id=chooser.choice(users),
+                    text='Комментарий под нагрузкой',
+                )
+
+        connection.close()
+        result = mixed_load(
+            read, write,
+            processes=options['processes'],
+            threads=options['threads'],
+            seconds=options['seconds'],
+            write_ratio=options['write_ratio'],
+        ).as_dict()
+        result['database'] = {
+            key: connection.settings_dict.get(key)
+            for key in ('ENGINE', 'PRAGMAS', 'TRANSACTION_MODE', 'WRITE_QUEUE')
+        }
+        result['processes'] = options['processes']
+        result['threads'] = options['threads']
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+        for kind in ('read', 'write'):
+            stats = result[kind]
+            self.stdout.write(
+                f"{kind:<6} {stats['ops_per_second']:8.1f} оп/с  "
+                f"p50 {stats['p50_ms']:7.2f} мс  "
+                f"p95 {stats['p95_ms']:7.2f} мс  "
+                f"ошибок {stats['errors']}"
+            )
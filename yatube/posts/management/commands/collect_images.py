@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.blobs import collect, repair
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает ссылки на картинки и удаляет файлы без ссылок'
+
+    def handle(self, *args, **options):
+        repaired = repair()
+        collected = collect()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено ссылок: {repaired}, удалено файлов: {collected}'
+        ))
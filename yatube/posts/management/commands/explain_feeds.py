@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts.plans import query_plans
+
+
+class Command(BaseCommand):
+    help = ('Показывает планы запросов основных лент на текущих данных '
+            'и отмечает те, что сортируют результат вместо чтения индекса')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Печатать план целиком')
+
+    def handle(self, *args, **options):
+        sorting = 0
+        for plan in query_plans():
+            if plan.sorts:
+                sorting += 1
+                status = self.style.WARNING('сортировка')
+            else:
+                status = self.style.SUCCESS('индекс')
+            self.stdout.write(f'{plan.name:<14} {plan.ms:9.2f} мс  {status}')
+            if options['verbose_plans'] or plan.sorts:
+                for line in plan.plan.splitlines():
+                    self.stdout.write(f'    {line}')
+        if sorting:
+            self.stdout.write(self.style.WARNING(
+                f'Запросов с сортировкой: {sorting}'))
@@ -0,0 +1,69 @@
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу сгенерированными данными для нагрузочных замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок у пользователя')
+        parser.add_argument(
+            '--follower-skew', type=float, default=1.0,
+            help='Показатель степенного закона для подписчиков авторов')
+        parser.add_argument(
+            '--group-skew', type=float, default=1.0,
+            help='Показатель степенного закона для постов в группах')
+        parser.add_argument(
+            '--images', type=float, default=0.0,
+            help='Доля постов с картинкой, от 0 до 1')
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней распределить даты постов')
+        parser.add_argument(
+            '--age-skew', type=float, default=1.0,
+            help='Показатель степенного закона для возраста постов')
+        parser.add_argument(
+            '--password', default='yatube',
+            help='Пароль всех сгенерированных пользователей')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь')
+        if not 0 <= options['images'] <= 1:
+            raise CommandError('--images задаётся долей от 0 до 1')
+        if options['days'] < 1:
+            raise CommandError('--days должно быть не меньше 1')
+        started = time.monotonic()
+        Seeder(
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            comments=options['comments'],
+            follows=options['follows'],
+            follower_skew=options['follower_skew'],
+            group_skew=options['group_skew'],
+            images=options['images'],
+            days=options['days'],
+            age_skew=options['age_skew'],
+            password=options['password'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        ).run()
+        # Данные записаны мимо сигналов: закэшированные ленты устарели
+        for alias in ('posts', 'hot'):
+            caches[alias].clear()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с'))
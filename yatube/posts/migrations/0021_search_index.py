@@ -0,0 +1,41 @@
+from django.db import migrations
+
+NORMALIZED = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def create_index(apps, schema_editor):
+    # Полнотекстовый индекс есть только у SQLite; на других СУБД
+    # поиск работает через posts.search.DatabaseBackend
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE IF NOT EXISTS posts_search USING fts5('
+        'text, group_title, group_description, '
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        'INSERT INTO posts_search '
+        '(rowid, text, group_title, group_description) '
+        'SELECT p.id, {}, {}, {} FROM posts_post p '
+        'LEFT JOIN posts_group g ON g.id = p.group_id'.format(
+            NORMALIZED.format('p.text'),
+            NORMALIZED.format('g.title'),
+            NORMALIZED.format('g.description'),
+        )
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,135 @@
+import hashlib
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+from django.utils.cache import patch_vary_headers
+
+from core.cache import app_cache
+from core.conditional import not_modified, page_etag, validated
+from core.db import use_primary
+from yatube.settings import FEED_CACHE_LOCK_TIMEOUT, FEED_CACHE_TIMEOUT
+
+from .cards import changed_recently, mark_changed
+
+cache = app_cache('posts')
+
+
+def _key(prefix, *parts):
+    # В ленте может быть кириллический username и длинный query string,
+    # а ключ должен подходить и для memcached
+    digest = hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+    return f'{prefix}:{digest}'
+
+
+def _new_generation():
+    return int(time.time() * 1000)
+
+
+def invalidate(*scopes):
+    """Делает устаревшими все закэшированные страницы этих лент."""
+    keys = {_key('feed_generation', scope) for scope in scopes}
+    mark_changed(keys)
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_generation(), None)
+
+
+def feed_generation(scope):
+    """Поколение ленты: меняется при каждой записи, которая её меняет."""
+    key = _key('feed_generation', scope)
+    generation = cache.get(key)
+    if generation is None:
+        generation = _new_generation()
+        cache.add(key, generation, None)
+        generation = cache.get(key, generation)
+    return generation
+
+
+def feed_changed(scope):
+    """Менялась ли лента за последние REPLICA_STICKY_SECONDS."""
+    return changed_recently([_key('feed_generation', scope)])
+
+
+def primary_while_changed(scope):
+    """Декоратор view, которое кэширует карточки постов ленты scope.
+
+    Пока лента недавно менялась, view читает с основной базы: иначе
+    отстающая реплика положила бы в кэш старую карточку под новой
+    версией. В остальное время чтение остаётся на репликах.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with use_primary() if feed_changed(scope) else nullcontext():
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _cacheable(response):
+    """Как у UpdateCacheMiddleware: ответ с cookie или с Cache-Control:
+    private не кэшируется — страницу анонима получат все анонимы,
+    а с ней и чужие cookie."""
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and 'private' not in response.get('Cache-Control', ())
+    )
+
+
+def cache_feed(scope_template):
+    """Кэширует страницу ленты до записи, которая её меняет.
+
+    `scope_template` форматируется аргументами view: 'group:{slug}'.
+    Страница хранится вместе с поколением ленты; после `invalidate`
+    её перестраивает один запрос, а остальные пока получают старую
+    версию вместо того, чтобы строить её одновременно.
+    ETag страницы тоже строится из поколения: клиенту, у которого
+    она уже есть, отвечаем 304, не доставая её из кэша.
+    Страница строится по репликам, а в первые REPLICA_STICKY_SECONDS
+    после изменения ленты — по основной базе: с отстающей реплики в кэш
+    под новым поколением попала бы старая лента.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            scope = scope_template.format(**kwargs)
+            user = request.user.pk if request.user.is_authenticated else 0
+            path = request.get_full_path()
+            page_key = _key('feed_page', scope, user, path)
+            generation = feed_generation(scope)
+            etag = page_etag(request, scope, generation)
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+            cached = cache.get(page_key)
+            if cached is not None:
+                cached_generation, response = cached
+                if cached_generation == generation:
+                    return validated(request, response, etag)
+                lock_key = _key('feed_lock', scope, user, path)
+                if not cache.add(lock_key, 1, FEED_CACHE_LOCK_TIMEOUT):
+                    # Страницу уже перестраивают — отдаём прежнюю
+                    # без ETag: она старше текущего поколения
+                    return response
+            try:
+                primary = feed_changed(scope)
+                with use_primary() if primary else nullcontext():
+                    response = view(request, *args, **kwargs)
+                # Страница зависит от пользователя из cookie сессии
+                patch_vary_headers(response, ('Cookie',))
+                if _cacheable(response):
+                    cache.set(
+                        page_key, (generation, response), FEED_CACHE_TIMEOUT)
+            finally:
+                if cached is not None:
+                    cache.delete(lock_key)
+            return validated(request, response, etag)
+        return wrapper
+    return decorator
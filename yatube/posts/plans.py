@@ -0,0 +1,65 @@
+import time
+
+from django.db.models import Count
+
+from core.paginator import keyset
+from yatube.settings import COMMENTS_PER_PAGE, COUNT_LISTS
+
+from .feeds import feed
+from .models import Comment, Follow, Post, TimelineEntry
+
+# Как выглядит в плане сортировка результата: SQLite, PostgreSQL, MySQL
+SORT_MARKERS = ('TEMP B-TREE FOR ORDER BY', 'Sort', 'Using filesort')
+
+
+class QueryPlan:
+    """План запроса, время его выполнения и есть ли в нём сортировка."""
+
+    def __init__(self, name, queryset):
+        self.name = name
+        self.plan = queryset.explain()
+        started = time.perf_counter()
+        list(queryset)
+        self.ms = (time.perf_counter() - started) * 1000
+        self.sorts = any(marker in self.plan for marker in SORT_MARKERS)
+
+
+def busiest(queryset, field):
+    """Значение field, у которого больше всего строк в queryset."""
+    return (
+        queryset.values_list(field, flat=True)
+        .annotate(rows=Count('pk')).order_by('-rows').first()
+    )
+
+
+def access_patterns():
+    """Запросы первой страницы основных лент для самых длинных из них.
+
+    Чем длиннее лента, тем дороже сортировка без подходящего индекса.
+    """
+    author = busiest(Post.objects.all(), 'author')
+    group = busiest(Post.objects.exclude(group=None), 'group')
+    post = busiest(Comment.objects.all(), 'post')
+    user = busiest(TimelineEntry.objects.all(), 'user')
+    return {
+        'profile': keyset(feed(author=author), None)[:COUNT_LISTS + 1],
+        'group_list': keyset(feed(group=group), None)[:COUNT_LISTS + 1],
+        'comments': keyset(
+            Comment.objects.filter(post=post).select_related('author'),
+            None, date_field='created',
+        )[:COMMENTS_PER_PAGE + 1],
+        'follow_index': keyset(
+            TimelineEntry.objects.filter(user=user), None, pk_field='post_id',
+        )[:COUNT_LISTS + 1],
+        'following': Follow.objects.filter(
+            user=user).values_list('author', flat=True),
+        'followers': Follow.objects.filter(
+            author=author).values_list('user', flat=True),
+    }
+
+
+def query_plans():
+    return [
+        QueryPlan(name, queryset)
+        for name, queryset in access_patterns().items()
+    ]
@@ -0,0 +1,274 @@
+import re
+from functools import lru_cache
+
+from django.db import connection, connections, router
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from core.tasks import task
+from yatube.settings import SEARCH_BACKEND, SEARCH_MAX_RESULTS
+
+from .feeds import feed
+from .models import Group, Post
+
+WORD = re.compile(r'\w+')
+# Больше слов в запросе не нужно, а каждое удорожает поиск
+MAX_TERMS = 10
+# Более короткие слова ищутся целиком: префикс «в» совпал бы
+# с половиной словаря
+PREFIX_MIN_LENGTH = 3
+
+
+def terms(query):
+    """Слова запроса в нижнем регистре, без операторов и кавычек:
+    ввод пользователя не должен ломать синтаксис поиска."""
+    return WORD.findall(query.lower().replace('ё', 'е'))[:MAX_TERMS]
+
+
+class SearchBackend:
+    """Поисковый индекс постов по тексту, названию и описанию группы."""
+
+    def match(self, queryset, query):
+        """Посты queryset, подходящие под запрос, без сортировки."""
+        raise NotImplementedError
+
+    def window(self, query):
+        """Число найденных постов, не больше SEARCH_MAX_RESULTS,
+        и граница since для search: ранжируются только они."""
+        raise NotImplementedError
+
+    def search(self, query, offset, limit, since=None):
+        """id найденных постов от самых релевантных."""
+        raise NotImplementedError
+
+    def update_posts(self, post_ids):
+        pass
+
+    def update_group(self, group_id, removed=False):
+        """Переиндексирует посты группы; removed — группа удаляется."""
+
+    def remove_posts(self, post_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class DatabaseBackend(SearchBackend):
+    """Поиск всех слов запроса через icontains.
+
+    Индекса нет, каждый запрос просматривает таблицу: годится
+    для небольших баз на СУБД без FTS5.
+    """
+
+    def _filter(self, query):
+        words = terms(query)
+        if not words:
+            return None
+        condition = Q()
+        for word in words:
+            condition &= (
+                Q(text__icontains=word)
+                | Q(group__title__icontains=word)
+                | Q(group__description__icontains=word)
+            )
+        return condition
+
+    def match(self, queryset, query):
+        condition = self._filter(query)
+        if condition is None:
+            return queryset.none()
+        return queryset.filter(condition)
+
+    def window(self, query):
+        found = self.match(Post.objects.all(), query)
+        return found[:SEARCH_MAX_RESULTS].count(), None
+
+    def search(self, query, offset, limit, since=None):
+        return list(
+            self.match(Post.objects.all(), query)
+            .order_by('-pub_date', '-pk')
+            .values_list('pk', flat=True)[offset:offset + limit]
+        )
+
+
+class FTS5Backend(SearchBackend):
+    """Инвертированный индекс SQLite FTS5 в таблице posts_search.
+
+    rowid строки индекса — id поста, в ней копии текста поста, названия
+    и описания группы. Результаты ранжируются bm25: совпадение в тексте
+    поста весит больше, чем в группе. Ранжировать миллион совпадений
+    дорого, поэтому ранжируются только SEARCH_MAX_RESULTS самых новых:
+    FTS5 отдаёт их по убыванию rowid, не считая bm25.
+    """
+    table = 'posts_search'
+    weights = (1.0, 0.5, 0.25)
+
+    def expression(self, query):
+        """Запрос FTS5: все слова, длинные — как начало слова.
+
+        Стеммера для русского нет, поэтому «туман» находит и «тумане».
+        """
+        words = terms(query)
+        if not words:
+            return None
+        return ' '.join(
+            f'"{word}"*' if len(word) >= PREFIX_MIN_LENGTH else f'"{word}"'
+            for word in words
+        )
+
+    def match(self, queryset, query):
+        expression = self.expression(query)
+        if expression is None:
+            return queryset.none()
+        # RawSQL в pk__in попадает в лишние скобки, и SQLite берёт
+        # из подзапроса только первую строку
+        opts = queryset.model._meta
+        return queryset.extra(
+            where=[
+                f'"{opts.db_table}"."{opts.pk.column}" IN '
+                f'(SELECT rowid FROM {self.table} '
+                f'WHERE {self.table} MATCH %s)'
+            ],
+            params=[expression],
+        )
+
+    def _reader(self):
+        return connections[router.db_for_read(Post)]
+
+    def window(self, query):
+        expression = self.expression(query)
+        if expression is None:
+            return 0, None
+        with self._reader().cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} '
+                f'WHERE {self.table} MATCH %s ORDER BY rowid DESC LIMIT %s',
+                [expression, SEARCH_MAX_RESULTS],
+            )
+            rows = cursor.fetchall()
+        if len(rows) < SEARCH_MAX_RESULTS:
+            return len(rows), None
+        return len(rows), rows[-1][0]
+
+    def search(self, query, offset, limit, since=None):
+        expression = self.expression(query)
+        if expression is None:
+            return []
+        weights = ', '.join(map(str, self.weights))
+        with self._reader().cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} '
+                f'WHERE {self.table} MATCH %s AND rowid >= %s '
+                f'ORDER BY bm25({self.table}, {weights}), rowid DESC '
+                f'LIMIT %s OFFSET %s',
+                [expression, since or 0, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def _index(self, cursor, where, params, with_group=True):
+        # ё в индексе и в запросе заменяется на е: unicode61
+        # снимает диакритику только с латиницы
+        def normalized(column):
+            return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+        group_columns = (
+            f"{normalized('g.title')}, {normalized('g.description')}"
+            if with_group else "'', ''"
+        )
+        cursor.execute(
+            f'INSERT INTO {self.table} '
+            f'(rowid, text, group_title, group_description) '
+            f"SELECT p.id, {normalized('p.text')}, {group_columns} "
+            f'FROM {Post._meta.db_table} p '
+            f'LEFT JOIN {Group._meta.db_table} g ON g.id = p.group_id '
+            f'WHERE {where}',
+            params,
+        )
+
+    def update_posts(self, post_ids):
+        post_ids = list(post_ids)
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})',
+                post_ids,
+            )
+            self._index(cursor, f'p.id IN ({placeholders})', post_ids)
+
+    def update_group(self, group_id, removed=False):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid IN '
+                f'(SELECT id FROM {Post._meta.db_table} WHERE group_id = %s)',
+                [group_id],
+            )
+            self._index(
+                cursor, 'p.group_id = %s', [group_id], with_group=not removed)
+
+    def remove_posts(self, post_ids):
+        post_ids = list(post_ids)
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})',
+                post_ids,
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            self._index(cursor, '1 = 1', [])
+
+
+@lru_cache(maxsize=None)
+def backend():
+    """Поисковый индекс из настройки SEARCH_BACKEND."""
+    return import_string(SEARCH_BACKEND)()
+
+
+@task
+def index_posts(post_ids):
+    backend().update_posts(post_ids)
+
+
+@task
+def index_group(group_id):
+    backend().update_group(group_id)
+
+
+@task
+def unindex_posts(post_ids):
+    backend().remove_posts(post_ids)
+
+
+class SearchResults:
+    """Найденные посты для Paginator: срез читает из индекса
+    только id своей страницы, а посты — одним запросом ленты."""
+
+    def __init__(self, query):
+        self.query = query
+        self._window = None
+
+    def count(self):
+        if self._window is None:
+            self._window = backend().window(self.query)
+        return self._window[0]
+
+    def __len__(self):
+        return self.count()
+
+    @property
+    def limited(self):
+        """Найдено больше, чем показывается."""
+        return self.count() >= SEARCH_MAX_RESULTS
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        self.count()
+        start = key.start or 0
+        ids = backend().search(
+            self.query, start, key.stop - start, since=self._window[1])
+        posts = feed(pk__in=ids).in_bulk()
+        return [posts[pk] for pk in ids if pk in posts]
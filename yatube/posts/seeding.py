@@ -0,0 +1,246 @@
+import io
+import random
+from array import array
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+
+from yatube.settings import TIMELINE_FANOUT_LIMIT
+
+from . import blobs, search
+from .models import Comment, Follow, Group, Post, TimelineEntry, UserCounter
+
+User = get_user_model()
+storage = Post._meta.get_field('image').storage
+
+# Сколько разных картинок сгенерировать: посты ссылаются на них по очереди
+IMAGE_POOL = 20
+
+
+def power_law(count, exponent):
+    """Накопленные веса для random.choices: k-й вариант выпадает
+    в k ** exponent раз реже первого."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def next_id(model):
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    return (last or 0) + 1
+
+
+class Seeder:
+    """Генератор данных для нагрузочных замеров.
+
+    Строки пишутся bulk_create пачками по batch_size, каждая пачка —
+    в своей транзакции. Сигналы при этом не срабатывают, поэтому ленты
+    подписок, счётчики, ссылки на картинки и поисковый индекс
+    заполняются здесь же.
+    Подписчики распределены по степенному закону, посты по группам —
+    тоже: первые пользователи и группы самые популярные. Возраст постов
+    в днях, до days, тоже: свежих постов больше, чем старых, а id
+    растут вместе с датой публикации.
+    """
+
+    def __init__(self, users, groups, posts, comments, follows,
+                 follower_skew=1.0, group_skew=1.0, images=0.0, days=365,
+                 age_skew=1.0, password='yatube', batch_size=5000, seed=0,
+                 log=None):
+        self.users = users
+        self.groups = groups
+        self.posts = posts
+        self.comments = comments
+        self.follows = follows
+        self.follower_skew = follower_skew
+        self.group_skew = group_skew
+        self.images = images
+        self.days = days
+        self.age_skew = age_skew
+        self.password = password
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.log = log or (lambda message: None)
+
+    def run(self):
+        self.create_users()
+        self.create_groups()
+        self.create_follows()
+        self.create_posts()
+        self.create_comments()
+        self.create_counters()
+        blobs.repair()
+        search.backend().rebuild()
+        self.reset_sequences()
+
+    def insert(self, model, objects):
+        objects = iter(objects)
+        total = 0
+        while True:
+            chunk = list(islice(objects, self.batch_size))
+            if not chunk:
+                return total
+            # Размер пачки внутри bulk_create Django подберёт под СУБД
+            with transaction.atomic():
+                model.objects.bulk_create(chunk)
+            total += len(chunk)
+
+    def create_users(self):
+        first = next_id(User)
+        self.user_ids = range(first, first + self.users)
+        password = make_password(self.password)
+        self.insert(User, (
+            User(id=pk, username=f'seed{pk}', password=password)
+            for pk in self.user_ids
+        ))
+        self.posts_count = array('L', [0]) * self.users
+        self.log(f'Пользователей: {self.users}')
+
+    def create_groups(self):
+        first = next_id(Group)
+        self.group_ids = range(first, first + self.groups)
+        self.insert(Group, (
+            Group(
+                id=pk,
+                title=f'Группа {pk}',
+                slug=f'seed-group-{pk}',
+                description=f'Сгенерированная группа {pk}',
+            )
+            for pk in self.group_ids
+        ))
+        self.log(f'Групп: {self.groups}')
+
+    def create_follows(self):
+        weights = power_law(self.users, self.follower_skew)
+        self.followers = {}
+        self.following_count = array('L', [0]) * self.users
+
+        def follows():
+            for user in self.user_ids:
+                authors = set(self.random.choices(
+                    self.user_ids,
+                    cum_weights=weights,
+                    k=self.random.randint(0, 2 * self.follows),
+                ))
+                authors.discard(user)
+                self.following_count[user - self.user_ids[0]] = len(authors)
+                for author in authors:
+                    self.followers.setdefault(
+                        author, array('L')).append(user)
+                    yield Follow(user_id=user, author_id=author)
+
+        total = self.insert(Follow, follows())
+        self.log(f'Подписок: {total}')
+
+    def create_images(self):
+        names = []
+        for number in range(IMAGE_POOL):
+            color = tuple(self.random.randrange(256) for _ in range(3))
+            content = io.BytesIO()
+            Image.new('RGB', (960, 640), color).save(content, 'JPEG')
+            names.append(storage.save(
+                f'posts/seed-{number}.jpg', ContentFile(content.getvalue())))
+        return names
+
+    def create_posts(self):
+        first = next_id(Post)
+        images = self.create_images() if self.images else []
+        group_weights = power_law(self.groups, self.group_skew)
+        self.comments_count = array('L', [0]) * self.posts
+        for index in self.random.choices(range(self.posts), k=self.comments):
+            self.comments_count[index] += 1
+        # Возраст в днях; по убыванию, чтобы новые посты получили большие id
+        ages = array('d', sorted(
+            (
+                day + self.random.random()
+                for day in self.random.choices(
+                    range(self.days),
+                    cum_weights=power_law(self.days, self.age_skew),
+                    k=self.posts,
+                )
+            ),
+            reverse=True,
+        ))
+        now = timezone.now()
+        entries = 0
+        for start in range(0, self.posts, self.batch_size):
+            chunk = []
+            for index in range(start, min(start + self.batch_size,
+                                          self.posts)):
+                author = self.random.choice(self.user_ids)
+                group = None
+                if self.groups and self.random.random() < 0.8:
+                    group = self.random.choices(
+                        self.group_ids, cum_weights=group_weights)[0]
+                image = ''
+                if images and self.random.random() < self.images:
+                    image = self.random.choice(images)
+                self.posts_count[author - self.user_ids[0]] += 1
+                chunk.append(Post(
+                    id=first + index,
+                    text=f'Сгенерированный пост {first + index}',
+                    author_id=author,
+                    group_id=group,
+                    image=image,
+                    comments_count=self.comments_count[index],
+                ))
+            with transaction.atomic():
+                Post.objects.bulk_create(chunk)
+                # auto_now_add ставит при вставке текущее время
+                for post in chunk:
+                    post.pub_date = now - timedelta(
+                        days=ages[post.pk - first])
+                Post.objects.bulk_update(chunk, ['pub_date'])
+            entries += self.fan_out(chunk)
+        self.first_post = first
+        self.log(f'Постов: {self.posts}, записей в лентах: {entries}')
+
+    def fan_out(self, posts):
+        """Ленты подписок для пачки постов, как сделал бы timeline.fan_out."""
+        return self.insert(TimelineEntry, (
+            TimelineEntry(
+                user_id=user, post_id=post.pk, pub_date=post.pub_date)
+            for post in posts
+            for user in self.followers.get(post.author_id, ())
+            if len(self.followers[post.author_id]) <= TIMELINE_FANOUT_LIMIT
+        ))
+
+    def create_comments(self):
+        def comments():
+            for index, count in enumerate(self.comments_count):
+                for _ in range(count):
+                    yield Comment(
+                        post_id=self.first_post + index,
+                        author_id=self.random.choice(self.user_ids),
+                        text='Сгенерированный комментарий',
+                    )
+
+        self.insert(Comment, comments())
+        self.log(f'Комментариев: {self.comments}')
+
+    def create_counters(self):
+        offset = self.user_ids[0]
+        self.insert(UserCounter, (
+            UserCounter(
+                user_id=user,
+                posts_count=self.posts_count[user - offset],
+                followers_count=len(self.followers.get(user, ())),
+                following_count=self.following_count[user - offset],
+            )
+            for user in self.user_ids
+        ))
+
+    def reset_sequences(self):
+        # id пользователей, групп и постов заданы явно: сдвигаем
+        # последовательности PostgreSQL и Oracle за них
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Group, Post])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,166 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from . import blobs, cards, counters, hot, search, thumbnails, timeline
+from .feeds import author_feeds, post_feeds
+from .models import Comment, Follow, Group, Post, UserCounter
+from .page_cache import invalidate
+
+User = get_user_model()
+# Столько постов удалённой группы переиндексирует одна задача
+INDEX_BATCH_SIZE = 500
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    instance._original_group_id = instance.group_id
+    instance._original_image = (
+        None if 'image' in instance.get_deferred_fields()
+        else instance.image.name
+    )
+
+
+@receiver(post_init, sender=Group)
+def group_loaded(sender, instance, **kwargs):
+    instance._original_slug = instance.slug
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    instance._original_username = instance.username
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    if created:
+        UserCounter.objects.get_or_create(user=instance)
+    elif update_fields != frozenset({'last_login'}):
+        # Вход на сайт не меняет карточки постов автора
+        cards.bump('user', instance.pk)
+        hot.forget_user(instance)
+        if instance.username != instance._original_username:
+            # Комментарии показаны с именем автора
+            post_ids = instance.comments.order_by().values_list(
+                'post_id', flat=True).distinct()
+            for post_id in post_ids:
+                cards.bump('comments', post_id)
+        invalidate(*author_feeds(
+            {instance.username, instance._original_username},
+            instance.posts.all(),
+        ))
+    instance._original_username = instance.username
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_saved(sender, instance, **kwargs):
+    cards.bump('group', instance.pk)
+    hot.forget_group(instance, instance.slug, instance._original_slug)
+    authors = User.objects.filter(
+        posts__group=instance).values_list('username', flat=True)
+    invalidate(
+        'groups',
+        f'group:{instance.slug}',
+        f'group:{instance._original_slug}',
+        *author_feeds(authors.distinct(), Post.objects.none()),
+    )
+    instance._original_slug = instance.slug
+
+
+@receiver(post_save, sender=Group)
+def group_indexed(sender, instance, **kwargs):
+    search.index_group.enqueue(
+        instance.pk, key=f'search:group:{instance.pk}')
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    # После удаления посты уже не найти по группе
+    instance._post_ids = list(
+        Post.objects.filter(group=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Group)
+def group_unindexed(sender, instance, **kwargs):
+    # Посты остаются без группы: убираем её из их строк индекса
+    for start in range(0, len(instance._post_ids), INDEX_BATCH_SIZE):
+        search.index_posts.enqueue(
+            instance._post_ids[start:start + INDEX_BATCH_SIZE])
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    cards.bump('post', instance.pk)
+    hot.forget_post(instance.pk)
+    invalidate(*post_feeds(instance))
+    search.index_posts.enqueue(
+        [instance.pk], key=f'search:post:{instance.pk}')
+    instance._original_group_id = instance.group_id
+    # Без загруженного поля image пост сохраняется без него
+    if (instance._original_image is not None
+            and instance.image.name != instance._original_image):
+        if instance.image:
+            blobs.attach(instance.image.name)
+            thumbnails.schedule(instance)
+        if instance._original_image:
+            blobs.release(instance._original_image)
+        instance._original_image = instance.image.name
+    if created:
+        counters.change_user(instance.author_id, posts_count=1)
+        timeline.fan_out.enqueue(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    hot.forget_post(instance.pk)
+    invalidate(*post_feeds(instance))
+    counters.change_user(instance.author_id, posts_count=-1)
+    search.unindex_posts.enqueue([instance.pk])
+    if instance.image:
+        blobs.release(instance.image.name)
+
+
+@receiver(post_save, sender=Comment)
+def comment_added(sender, instance, created, **kwargs):
+    cards.bump('comments', instance.post_id)
+    if created:
+        counters.change_post(instance.post_id, 1)
+        # Страница поста показывает число комментариев
+        hot.forget_post(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    cards.bump('comments', instance.post_id)
+    counters.change_post(instance.post_id, -1)
+    hot.forget_post(instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+def author_followed(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.user_id, following_count=1)
+        counters.change_user(instance.author_id, followers_count=1)
+        timeline.backfill.enqueue(instance.user_id, instance.author_id)
+        # Профили обоих показывают счётчики подписок, а в ленте
+        # подписчика меняется набор популярных авторов
+        invalidate(
+            f'profile:{instance.author.username}',
+            f'profile:{instance.user.username}',
+            f'timeline:{instance.user_id}',
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def author_unfollowed(sender, instance, **kwargs):
+    counters.change_user(instance.user_id, following_count=-1)
+    counters.change_user(instance.author_id, followers_count=-1)
+    timeline.prune.enqueue(instance.user_id, instance.author_id)
+    timeline.follower_lost(instance.author_id)
+    invalidate(
+        f'profile:{instance.author.username}',
+        f'profile:{instance.user.username}',
+        f'timeline:{instance.user_id}',
+    )
@@ -0,0 +1,42 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файлы под именем из SHA-256 содержимого.
+
+    Одинаковые загрузки попадают в один файл: если такой уже есть,
+    он переиспользуется вместе с миниатюрами sorl, которые привязаны
+    к имени. Ссылки на файлы считает `ImageBlob`.
+    """
+
+    def digest_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            os.path.dirname(name), digest[:2], digest[2:4],
+            digest + extension)
+
+    def get_available_name(self, name, max_length=None):
+        # Имя и так уникально для содержимого
+        return name
+
+    def _save(self, name, content):
+        name = self.digest_name(name, content)
+        if self.exists(name):
+            # Свежая отметка времени защищает файл от сборки мусора,
+            # пока новая ссылка на него не записана
+            os.utime(self.path(name))
+            return name
+        saved = super()._save(name, content)
+        if saved != name:
+            # Такой же файл одновременно записал другой запрос
+            self.delete(saved)
+        return name
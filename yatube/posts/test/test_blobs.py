@@ -0,0 +1,74 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from .. import blobs
+from ..models import ImageBlob, Post
+from .test_thumbnails import SMALL_GIF
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@mock.patch('posts.blobs.IMAGE_GC_GRACE', -1)
+class ImageBlobTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reposter')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, content=SMALL_GIF):
+        return Post.objects.create(
+            text='Репост',
+            author=self.user,
+            image=SimpleUploadedFile('small.gif', content, 'image/gif'),
+        )
+
+    def test_same_content_stored_once(self):
+        first = self.create_post()
+        second = self.create_post()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith('posts/'))
+        self.assertEqual(
+            ImageBlob.objects.get(name=first.image.name).references, 2)
+
+    def test_file_collected_after_last_reference(self):
+        first = self.create_post()
+        second = self.create_post()
+        storage = first.image.storage
+        name = first.image.name
+        first.delete()
+        blobs.collect()
+        self.assertTrue(storage.exists(name))
+        second.delete()
+        self.assertEqual(blobs.collect(), 1)
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+
+    def test_edit_releases_previous_image(self):
+        post = self.create_post()
+        old_name = post.image.name
+        post.image = SimpleUploadedFile(
+            'other.gif', SMALL_GIF + b'\x00', 'image/gif')
+        post.save()
+        self.assertEqual(ImageBlob.objects.get(name=old_name).references, 0)
+        self.assertEqual(
+            ImageBlob.objects.get(name=post.image.name).references, 1)
+
+    def test_repair_restores_references(self):
+        post = self.create_post()
+        ImageBlob.objects.all().delete()
+        self.assertEqual(blobs.repair(), 1)
+        self.assertEqual(
+            ImageBlob.objects.get(name=post.image.name).references, 1)
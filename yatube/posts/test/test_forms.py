@@ -1,13 +1,19 @@
+import io
 import shutil
 import tempfile
 from http import HTTPStatus
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
+from .. import forms
 from ..models import Comment, Group, Post
 
 User = get_user_model()
@@ -187,6 +193,7 @@ class PostvalidTests(TestCase):
         }
         for namespace in list_reveres.keys():
             with self.subTest(namespace=namespace):
+                cache.clear()
                 response = self.authorized2_client.get(namespace)
                 self.assertEqual(
                     response.context[
@@ -233,3 +240,133 @@ class PostvalidTests(TestCase):
         )
         self.assertEqual(
             userr.context.get('comments')[0].text, last_comment.text)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='uploader')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def upload(self, size=(300, 200)):
+        content = io.BytesIO()
+        exif = Image.Exif()
+        # Модель камеры
+        exif[0x0110] = 'Camera'
+        Image.new('RGB', size, 'red').save(content, 'JPEG', exif=exif)
+        return SimpleUploadedFile(
+            'photo.jpg', content.getvalue(), content_type='image/jpeg')
+
+    def create(self, image):
+        return self.client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с фото', 'image': image},
+        )
+
+    @mock.patch('posts.uploads.POST_IMAGE_MAX_SIDE', 100)
+    def test_image_reencoded_without_metadata(self):
+        self.create(self.upload())
+        post = Post.objects.get(text='Пост с фото')
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (100, 67))
+            self.assertFalse(image.getexif())
+
+    @mock.patch('core.uploads.UPLOAD_MAX_SIZE', 100)
+    def test_oversized_file_rejected(self):
+        response = self.create(self.upload())
+        self.assertFalse(Post.objects.filter(text='Пост с фото').exists())
+        self.assertIn(
+            'Файл больше', response.context['form'].errors['image'][0])
+
+    def noisy_jpeg(self):
+        content = io.BytesIO()
+        Image.effect_noise((1000, 800), 64).save(content, 'JPEG')
+        return content.getvalue()
+
+    def test_truncated_pixels_rejected(self):
+        data = self.noisy_jpeg()
+        with mock.patch('core.uploads.UPLOAD_MAX_SIZE', len(data) // 2):
+            response = self.create(SimpleUploadedFile(
+                'photo.jpg', data, content_type='image/jpeg'))
+        self.assertFalse(Post.objects.filter(text='Пост с фото').exists())
+        self.assertIn(
+            'Файл больше', response.context['form'].errors['image'][0])
+
+    def test_corrupt_image_rejected(self):
+        data = self.noisy_jpeg()
+        response = self.create(SimpleUploadedFile(
+            'photo.jpg', data[:len(data) // 2], content_type='image/jpeg'))
+        self.assertFalse(Post.objects.filter(text='Пост с фото').exists())
+        self.assertIn(
+            'Файл повреждён', response.context['form'].errors['image'][0])
+
+    @mock.patch('posts.forms.POST_IMAGE_MAX_PIXELS', 300 * 200 - 1)
+    def test_too_many_pixels_rejected(self):
+        response = self.create(self.upload())
+        self.assertFalse(Post.objects.filter(text='Пост с фото').exists())
+        self.assertIn(
+            'Картинка больше', response.context['form'].errors['image'][0])
+
+    def test_reencode_outside_transaction(self):
+        # Транзакция теста уже открыта: считаем блоки atomic поверх неё
+        depth = len(connection.savepoint_ids)
+        reencode = forms.reencode
+        depths = []
+
+        def record(upload):
+            depths.append(len(connection.savepoint_ids))
+            return reencode(upload)
+
+        with mock.patch.object(forms, 'reencode', record):
+            self.create(self.upload())
+        self.assertEqual(depths, [depth])
+        self.assertTrue(Post.objects.filter(text='Пост с фото').exists())
+
+    def test_phone_mpo_saved_as_jpeg(self):
+        content = io.BytesIO()
+        main, preview = Image.new('RGB', (300, 200), 'red'), Image.new(
+            'RGB', (30, 20), 'blue')
+        main.save(content, 'MPO', save_all=True, append_images=[preview])
+        self.create(SimpleUploadedFile(
+            'photo.jpg', content.getvalue(), content_type='image/jpeg'))
+        post = Post.objects.get(text='Пост с фото')
+        with Image.open(post.image) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (300, 200))
+
+    @mock.patch('posts.uploads.POST_IMAGE_MAX_SIDE', 10)
+    def test_animation_keeps_frames(self):
+        content = io.BytesIO()
+        frames = [Image.new('RGB', (20, 20), color)
+                  for color in ('red', 'green', 'blue')]
+        frames[0].save(content, 'GIF', save_all=True,
+                       append_images=frames[1:], duration=50, loop=0)
+        self.create(SimpleUploadedFile(
+            'cat.gif', content.getvalue(), content_type='image/gif'))
+        post = Post.objects.get(text='Пост с фото')
+        with Image.open(post.image) as image:
+            self.assertEqual(image.n_frames, 3)
+            self.assertEqual(image.size, (10, 10))
+            self.assertEqual(image.info['duration'], 50)
+
+    @mock.patch('posts.forms.POST_IMAGE_MAX_PIXELS', 20 * 20 * 2)
+    def test_animation_pixels_counted_over_frames(self):
+        content = io.BytesIO()
+        frames = [Image.new('RGB', (20, 20), color)
+                  for color in ('red', 'green', 'blue')]
+        frames[0].save(content, 'GIF', save_all=True,
+                       append_images=frames[1:])
+        response = self.create(SimpleUploadedFile(
+            'cat.gif', content.getvalue(), content_type='image/gif'))
+        self.assertFalse(Post.objects.filter(text='Пост с фото').exists())
+        self.assertIn(
+            'Картинка больше', response.context['form'].errors['image'][0])
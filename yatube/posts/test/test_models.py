@@ -1,7 +1,12 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
 
-from ..models import Group, Post
+from ..forms import PostForm
+from ..models import Comment, Follow, Group, Post, UserCounter
 
 User = get_user_model()
 
@@ -42,3 +47,65 @@ class PostModelTest(TestCase):
         post = PostModelTest.post
         help_text = post._meta.get_field('group').help_text
         self.assertEqual(help_text, 'Выберите группу')
+
+
+class CounterModelTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_counters_follow_writes(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        counters = UserCounter.objects.get(user=self.author)
+        self.assertEqual(counters.posts_count, 1)
+        self.assertEqual(counters.followers_count, 1)
+        self.assertEqual(
+            UserCounter.objects.get(user=self.reader).following_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        follow.delete()
+        post.delete()
+        counters.refresh_from_db()
+        self.assertEqual(counters.posts_count, 0)
+        self.assertEqual(counters.followers_count, 0)
+
+    def test_repair_counters_command(self):
+        Post.objects.create(author=self.author, text='Пост')
+        UserCounter.objects.filter(user=self.author).update(posts_count=7)
+        UserCounter.objects.filter(user=self.reader).delete()
+        call_command('repair_counters', stdout=StringIO())
+        self.assertEqual(
+            UserCounter.objects.get(user=self.author).posts_count, 1)
+        self.assertEqual(
+            UserCounter.objects.get(user=self.reader).posts_count, 0)
+
+    def test_missing_counters_not_written_on_read(self):
+        Post.objects.create(author=self.author, text='Пост')
+        UserCounter.objects.filter(user=self.author).delete()
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'author'}))
+        self.assertEqual(response.context['post_count'], 0)
+        self.assertFalse(
+            UserCounter.objects.filter(user=self.author).exists())
+
+    def test_post_save_keeps_comments_count(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        # Форма сохраняет пост, загруженный до комментария
+        form = PostForm({'text': 'Правка'}, instance=post)
+        self.assertTrue(form.is_valid())
+        form.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Правка')
+        self.assertEqual(post.comments_count, 1)
+
+    def test_post_page_shows_comments_count(self):
+        post = Post.objects.create(author=self.author, text='Пост')
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.assertContains(self.client.get(url), 'Комментариев:  <span >0')
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        self.assertContains(self.client.get(url), 'Комментариев:  <span >1')
@@ -0,0 +1,26 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..plans import query_plans
+from ..seeding import Seeder
+
+
+class QueryPlanTests(TestCase):
+    """Ленты читаются по составным индексам, без сортировки результата."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Seeder(users=30, groups=3, posts=300, comments=300, follows=5).run()
+
+    def test_feeds_use_indexes(self):
+        for plan in query_plans():
+            with self.subTest(query=plan.name):
+                self.assertFalse(plan.sorts, plan.plan)
+
+    def test_explain_feeds(self):
+        out = StringIO()
+        call_command('explain_feeds', stdout=out)
+        self.assertNotIn('сортировка', out.getvalue())
+        self.assertIn('profile', out.getvalue())
@@ -0,0 +1,113 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from yatube.settings import COUNT_LISTS
+
+from .. import search
+from ..models import Group, Post
+
+User = get_user_model()
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Ежи', slug='hedgehogs', description='Всё про ёжиков')
+        cls.in_text = Post.objects.create(
+            text='Ёжик в тумане ищет лошадку', author=cls.author)
+        cls.in_group = Post.objects.create(
+            text='Туман над рекой', author=cls.author, group=cls.group)
+        cls.other = Post.objects.create(
+            text='Совсем другой пост', author=cls.author)
+
+    def found(self, query):
+        count, since = search.backend().window(query)
+        return search.backend().search(query, 0, COUNT_LISTS, since)
+
+    def test_ranked_by_text_before_group(self):
+        self.assertEqual(
+            self.found('ежик'), [self.in_text.pk, self.in_group.pk])
+        self.assertEqual(search.backend().window('ежик'), (2, None))
+
+    def test_prefix_and_all_words(self):
+        self.assertEqual(self.found('тум лошад'), [self.in_text.pk])
+        self.assertEqual(self.found('про ежиков туман'), [self.in_group.pk])
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.found('" OR NEAR( *'), [])
+        self.assertEqual(self.found(''), [])
+
+    def test_index_follows_changes(self):
+        post = Post.objects.get(pk=self.in_text.pk)
+        post.text = 'Теперь про медвежонка'
+        post.save()
+        self.assertEqual(self.found('ежик'), [self.in_group.pk])
+        self.assertEqual(self.found('медвежонка'), [post.pk])
+        Post.objects.get(pk=self.other.pk).delete()
+        self.assertEqual(self.found('другой'), [])
+
+    def test_index_follows_group(self):
+        group = Group.objects.get(pk=self.group.pk)
+        group.description = 'Про белок'
+        group.save()
+        self.assertEqual(self.found('белок'), [self.in_group.pk])
+        group.delete()
+        self.assertEqual(self.found('белок'), [])
+        self.assertCountEqual(
+            self.found('туман'), [self.in_text.pk, self.in_group.pk])
+
+    def test_rebuild(self):
+        Post.objects.filter(pk=self.other.pk).update(text='Обновлён мимо')
+        search.backend().rebuild()
+        self.assertEqual(self.found('мимо'), [self.other.pk])
+
+    def test_search_page(self):
+        for number in range(COUNT_LISTS + 1):
+            Post.objects.create(text=f'Лошадка {number}', author=self.author)
+        url = reverse('posts:search')
+        response = self.client.get(url, {'q': 'лошадка'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.paginator.count, COUNT_LISTS + 1)
+        self.assertEqual(len(page_obj), COUNT_LISTS)
+        response = self.client.get(url, {'q': 'лошадка', 'page': 2})
+        self.assertEqual(len(response.context['page_obj']), 1)
+        response = self.client.get(url)
+        self.assertIsNone(response.context['page_obj'])
+
+    def test_only_newest_matches_are_ranked(self):
+        newer = Post.objects.create(
+            text='Туман, туман, туман', author=self.author)
+        with mock.patch.object(search, 'SEARCH_MAX_RESULTS', 2):
+            count, since = search.backend().window('туман')
+            self.assertEqual((count, since), (2, self.in_group.pk))
+            self.assertEqual(
+                search.backend().search('туман', 0, COUNT_LISTS, since),
+                [newer.pk, self.in_group.pk],
+            )
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'ежик'})
+        self.assertEqual(
+            {post.pk for post in response.context['cl'].result_list},
+            {self.in_text.pk, self.in_group.pk},
+        )
+
+
+class DatabaseBackendTests(TestCase):
+    def test_icontains_search(self):
+        author = User.objects.create_user(username='author')
+        post = Post.objects.create(text='Ёжик в тумане', author=author)
+        Post.objects.create(text='Другое', author=author)
+        backend = search.DatabaseBackend()
+        self.assertEqual(backend.search('ТУМАН', 0, 10), [post.pk])
+        self.assertEqual(backend.window('ежик туман'), (0, None))
+        self.assertEqual(backend.window('туман'), (1, None))
@@ -0,0 +1,50 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase
+
+from ..counters import repair_posts, repair_users
+from ..models import Comment, Follow, Post, TimelineEntry
+
+User = get_user_model()
+
+
+class SeedCommandTests(TestCase):
+    def test_seed_yatube(self):
+        call_command(
+            'seed_yatube', users=30, groups=3, posts=200, comments=300,
+            follows=5, batch_size=70, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        # Счётчики и ленты такие же, как после записи через сигналы
+        self.assertEqual(repair_users(), 0)
+        self.assertEqual(repair_posts(), 0)
+        expected = Follow.objects.filter(
+            author__posts__isnull=False).count()
+        self.assertEqual(TimelineEntry.objects.count(), expected)
+        self.assertFalse(TimelineEntry.objects.exclude(
+            pub_date=F('post__pub_date')).exists())
+
+    def test_seed_spreads_pub_dates(self):
+        call_command(
+            'seed_yatube', users=5, groups=1, posts=200, comments=0,
+            follows=1, days=365, batch_size=70, stdout=StringIO())
+        dates = list(
+            Post.objects.order_by('pk').values_list('pub_date', flat=True))
+        # Новые посты получают большие id
+        self.assertEqual(dates, sorted(dates))
+        self.assertGreater(dates[-1] - dates[0], timedelta(days=30))
+        self.assertLess(dates[-1] - dates[0], timedelta(days=365))
+
+    def test_seed_appends_to_existing_data(self):
+        Post.objects.create(
+            text='Старый пост', author=User.objects.create_user('old'))
+        call_command(
+            'seed_yatube', users=5, groups=1, posts=10, comments=0,
+            follows=1, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 11)
+        self.assertTrue(User.objects.filter(username='old').exists())
@@ -0,0 +1,107 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.models import Job
+from core.tasks import DatabaseBroker
+
+from .. import thumbnails
+from ..models import Post
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailPipelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='painter')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def create_post(self):
+        return Post.objects.create(
+            text='Пост с картинкой',
+            author=self.user,
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    def test_saving_new_image_schedules_thumbnails(self):
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            post = self.create_post()
+            schedule.assert_called_once_with(post)
+            post.text = 'Новый текст'
+            post.save()
+            schedule.assert_called_once()
+
+    def test_feed_shows_placeholder_until_thumbnails_ready(self):
+        post = self.create_post()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'img/placeholder.svg')
+        thumbnails.generate(post.pk)
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'img/placeholder.svg')
+        self.assertContains(response, settings.MEDIA_URL + 'cache/')
+
+    def test_page_thumbnails_resolved_in_one_lookup(self):
+        posts = [self.create_post() for _ in range(5)]
+        for post in posts:
+            thumbnails.generate(post.pk)
+        cache.clear()
+        with self.assertNumQueries(1):
+            resolved = thumbnails.with_thumbnails(posts, 'feed')
+        with self.assertNumQueries(0):
+            thumbnails.with_thumbnails(posts, 'feed')
+        self.assertTrue(all(
+            post.thumbnail.url.startswith(settings.MEDIA_URL + 'cache/')
+            for post in resolved))
+
+    def test_feed_offers_narrow_and_webp_variants(self):
+        post = self.create_post()
+        thumbnails.generate(post.pk)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<source type="image/webp"')
+        picture = response.context['page_obj'][0].thumbnail
+        for width in (480, 800, 1200):
+            with self.subTest(width=width):
+                self.assertIn(f' {width}w', picture.srcset)
+                self.assertIn(f'.webp {width}w', picture.sources[-1][1])
+
+    @mock.patch('core.tasks.broker', mock.Mock(return_value=DatabaseBroker()))
+    def test_placeholder_views_queue_one_job(self):
+        with mock.patch.object(thumbnails, 'schedule'):
+            post = self.create_post()
+        jobs = Job.objects.filter(name=thumbnails.generate.name)
+        for _ in range(3):
+            thumbnails._enqueue(post.pk, post.image.name)
+        self.assertEqual(jobs.count(), 1)
+        # Пока воркер выполняет задачу, её ключ снят
+        jobs.update(key=None)
+        thumbnails._enqueue(post.pk, post.image.name)
+        self.assertEqual(jobs.count(), 1)
+        # Новая картинка — новая задача
+        thumbnails._enqueue(post.pk, 'posts/other.gif')
+        self.assertEqual(jobs.count(), 2)
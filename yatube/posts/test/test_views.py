@@ -1,12 +1,23 @@
+from unittest import mock
+
 from django import forms
 from django.contrib.auth import get_user_model
-from django.core.cache import cache
-from django.test import Client, TestCase
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache, caches
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase
 from django.urls import reverse
+from django.utils.html import escape
 
-from yatube.settings import COUNT_LISTS
+from core import parallel
+from core.db import pinned
+from core.models import Job
+from core.tasks import DatabaseBroker, work
+from yatube.settings import COMMENTS_PER_PAGE, COUNT_LISTS
 
-from ..models import Follow, Group, Post
+from .. import hot, views
+from ..page_cache import cache_feed, invalidate
+from ..models import Comment, Follow, Group, Post, TimelineEntry
 
 User = get_user_model()
 
@@ -185,14 +196,28 @@ class PostPagesTests(TestCase):
         check_home_page = self.authorized_client.get(url)
         self.assertEqual(check_home_page.context[
             'page_obj'][0].text, post_new.text)
-        post_new.delete()
+        # Пока лента не менялась, страница отдаётся из кэша
         check_home_page2 = self.authorized_client.get(url)
         self.assertEqual(check_home_page2.context, None)
-        cache.clear()
+        self.assertEqual(check_home_page2.content, check_home_page.content)
+        # Удаление поста сразу сбрасывает кэш ленты
+        post_new.delete()
         check_home_page3 = self.authorized_client.get(url)
         self.assertEqual(check_home_page3.context[
             'page_obj'][0].text, PostPagesTests.post.text)
 
+    def test_cache_serves_stale_page_while_rebuilding(self):
+        url = reverse('posts:index')
+        self.client.get(url)
+        post_new = Post.objects.create(
+            text='Свежий пост', author=PostPagesTests.user)
+        with mock.patch('posts.page_cache.cache.add', return_value=False):
+            # Другой запрос уже перестраивает страницу
+            stale = self.client.get(url)
+        self.assertIsNone(stale.context)
+        self.assertNotContains(stale, post_new.text)
+        self.assertContains(self.client.get(url), post_new.text)
+
     def test_user_follow(self):
         new_user = User.objects.create(username='подписчик')
         response = self.authorized_client.post(
@@ -249,6 +274,9 @@ class PaginatorViewsTest(TestCase):
                 group=cls.groupZ
             ))
 
+    def setUp(self):
+        cache.clear()
+
     def test_first_page_contains_ten_records(self):
         response = self.client.get(reverse('posts:index'))
         self.assertEqual(len(response.context['page_obj']), COUNT_LISTS)
@@ -258,3 +286,477 @@ class PaginatorViewsTest(TestCase):
         self.assertEqual(len(
             response.context['page_obj']
         ), Post.objects.count() - COUNT_LISTS)
+
+    def test_next_cursor_page(self):
+        # Вторая страница по курсору совпадает со второй по номеру
+        response = self.client.get(reverse('posts:index'))
+        next_cursor = response.context['page_obj'].next_cursor
+        self.assertIsNotNone(next_cursor)
+        response2 = self.client.get(
+            reverse('posts:index'), {'cursor': next_cursor})
+        page_obj = response2.context['page_obj']
+        self.assertEqual(page_obj.number, 2)
+        self.assertFalse(page_obj.has_next())
+        self.assertEqual(
+            [post.pk for post in page_obj],
+            [post.pk for post in reversed(self.create_list[:3])]
+        )
+        # И обратно на первую
+        response3 = self.client.get(
+            reverse('posts:index'), {'cursor': page_obj.previous_cursor})
+        self.assertEqual(response3.context['page_obj'].number, 1)
+        self.assertEqual(
+            len(response3.context['page_obj']), COUNT_LISTS)
+
+    def test_page_links_keep_query(self):
+        response = self.client.get(
+            reverse('posts:index'), {'q': 'кот', 'page': 1})
+        page_obj = response.context['page_obj']
+        self.assertEqual(
+            page_obj.next_query,
+            f'?q=%D0%BA%D0%BE%D1%82&cursor={page_obj.next_cursor}')
+        self.assertContains(response, f'href="{escape(page_obj.next_query)}"')
+        response = self.client.get(
+            reverse('posts:index') + page_obj.next_query)
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 2)
+        self.assertIn('q=%D0%BA%D0%BE%D1%82', page_obj.previous_query)
+        self.assertEqual(page_obj.first_query, '?q=%D0%BA%D0%BE%D1%82&page=1')
+
+    def test_bad_cursor_returns_first_page(self):
+        response = self.client.get(
+            reverse('posts:index'), {'cursor': 'не курсор'})
+        self.assertEqual(response.context['page_obj'].number, 1)
+
+
+class FollowTimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.old_post = Post.objects.create(
+            text='Старый пост', author=cls.author)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        self.authorized_client.get(
+            reverse('posts:profile_follow', args=[self.author]))
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=self.old_post).exists())
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, self.old_post])
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', args=[self.author]))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+
+    @mock.patch('core.tasks.broker', mock.Mock(return_value=DatabaseBroker()))
+    @mock.patch('core.tasks.close_old_connections', mock.Mock())
+    def test_queued_follow_and_unfollow(self):
+        self.authorized_client.get(
+            reverse('posts:profile_follow', args=[self.author]))
+        # Запрос только ставит задачу, ленту собирает воркер
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(Job.objects.count(), 1)
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', args=[self.author]))
+        self.authorized_client.get(
+            reverse('posts:profile_follow', args=[self.author]))
+        work(lambda: False, burst=True)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=self.old_post).exists())
+        self.assertFalse(Job.objects.exists())
+
+    def test_follow_feed_is_one_query_over_timeline(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        page_obj = response.context['page_obj']
+        with self.assertNumQueries(1):
+            page_obj.paginator.fetch(None, COUNT_LISTS)
+
+    @mock.patch('posts.timeline.TIMELINE_FANOUT_LIMIT', 0)
+    def test_popular_author_read_on_request(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=new_post).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, self.old_post])
+
+    @mock.patch('posts.timeline.TIMELINE_FANOUT_LIMIT', 1)
+    def test_author_no_longer_popular_refills_timelines(self):
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=new_post).exists())
+        Follow.objects.filter(user=other).delete()
+        # Посты больше не подмешиваются при чтении — они в ленте
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, self.old_post])
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=new_post).exists())
+
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='card')
+        cls.group = Group.objects.create(
+            title='Карточки',
+            slug='cards',
+            description='Кэш карточек',
+        )
+        cls.post = Post.objects.create(
+            text='Первый текст', author=cls.user, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('posts:group_list', args=[self.group.slug])
+
+    def test_card_is_cached_until_post_saved(self):
+        self.client.get(self.url)
+        # update() обходит сигналы — карточка остаётся из кэша
+        Post.objects.filter(pk=self.post.pk).update(text='Тихая правка')
+        self.assertContains(self.client.get(self.url), 'Первый текст')
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст'
+        post.save()
+        self.assertContains(self.client.get(self.url), 'Новый текст')
+
+    def test_card_invalidated_by_author_change(self):
+        self.client.get(self.url)
+        self.user.first_name = 'Карл'
+        self.user.save()
+        self.assertContains(self.client.get(self.url), 'Карл')
+
+
+class ReplicaCacheTests(TestCase):
+    """Страницы читают с реплик, а сразу после изменения их данных —
+    с основной базы: в кэш не попадает старая версия."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='replica')
+        cls.post = Post.objects.create(text='Пост', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_feeds_read_from_primary_only_after_change(self):
+        reads = []
+
+        def with_card_versions(posts):
+            reads.append(pinned())
+            return posts
+
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': 'replica'}),
+            reverse('posts:search'),
+            reverse('posts:follow_index'),
+        ]
+        with mock.patch.object(
+                views, 'with_card_versions', with_card_versions):
+            for url in urls:
+                self.client.get(url, {'q': 'Пост'})
+            self.assertEqual(reads, [False] * len(urls))
+            reads.clear()
+            invalidate('index', 'profile:replica')
+            for url in urls:
+                self.client.get(url, {'q': 'Пост'})
+        self.assertEqual(reads, [True] * len(urls))
+
+    def test_post_page_read_from_primary_after_comment(self):
+        reads = []
+        comment_page = views.comment_page
+
+        def record(request, post_id):
+            reads.append(pinned())
+            return comment_page(request, post_id)
+
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with mock.patch.object(views, 'comment_page', record):
+            self.client.get(url)
+            Comment.objects.create(
+                post=self.post, author=self.user, text='Свежий')
+            self.client.get(url)
+        self.assertEqual(reads, [False, True])
+
+    def test_hot_objects_loaded_from_primary(self):
+        loads = []
+        load_post = hot._load_post
+
+        def record(pk):
+            loads.append(pinned())
+            return load_post(pk)
+
+        with mock.patch.object(hot, '_load_post', record):
+            self.client.get(
+                reverse('posts:comments', kwargs={'post_id': self.post.pk}))
+        self.assertEqual(loads, [True])
+
+
+class ProfileFollowingTests(TestCase):
+    """Профиль знает, подписан ли на автора читатель.
+
+    Бюджеты запросов лент — в core/test_budgets.py.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        author = User.objects.create_user(username='author0')
+        Follow.objects.create(user=cls.reader, author=author)
+        Post.objects.create(text='Пост', author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def test_profile_following_flag(self):
+        url = reverse('posts:profile', kwargs={'username': 'author0'})
+        self.assertTrue(self.client.get(url).context['following'])
+        self.client.logout()
+        self.assertFalse(self.client.get(url).context['following'])
+
+    def test_follower_profile_counts_refreshed(self):
+        url = reverse('posts:profile', kwargs={'username': 'reader'})
+        self.assertContains(self.client.get(url), 'Подписок: 1')
+        author = User.objects.create_user(username='author1')
+        self.client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'author1'}))
+        self.assertContains(self.client.get(url), 'Подписок: 2')
+        Follow.objects.filter(author=author).delete()
+        self.assertContains(self.client.get(url), 'Подписок: 1')
+
+
+class CommentPageTests(TestCase):
+    """Комментарии поста выводятся порциями по курсору."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+        cls.commenters = [
+            User.objects.create_user(username=f'commenter{number}')
+            for number in range(COMMENTS_PER_PAGE + 5)
+        ]
+        for number, user in enumerate(cls.commenters):
+            Comment.objects.create(
+                post=cls.post, author=user, text=f'Комментарий {number}')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_first_page_is_constant_size(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.client.get(url)
+        # Пост уже в кэше: счётчики автора и одна порция комментариев
+        # вместе с их авторами
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_PER_PAGE)
+        self.assertEqual(
+            comments[0].text, f'Комментарий {len(self.commenters) - 1}')
+        self.assertIsNotNone(comments.next_cursor)
+
+    def test_cold_post_page_queries(self):
+        caches['hot'].clear()
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        # Пост с автором и группой, счётчики автора, комментарии
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+    def test_hot_cache_keeps_no_secrets(self):
+        caches['hot'].clear()
+        hot.get_post(self.post.pk)
+        author = caches['hot'].get(f'user:{self.author.pk}')
+        self.assertEqual(author.username, 'author')
+        self.assertTrue(
+            {'password', 'email', 'is_staff'} <= author.get_deferred_fields())
+
+    def test_fragment_loads_next_comments(self):
+        detail = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        response = self.client.get(
+            reverse('posts:comments', kwargs={'post_id': self.post.pk}),
+            {'cursor': detail.context['comments'].next_cursor},
+        )
+        self.assertTemplateUsed(response, 'includes/comments.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            [f'Комментарий {number}' for number in range(4, -1, -1)],
+        )
+        self.assertIsNone(response.context['comments'].next_cursor)
+
+    def test_fragment_for_missing_post(self):
+        response = self.client.get(
+            reverse('posts:comments', kwargs={'post_id': self.post.pk + 1}))
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+    """Неизменившиеся страницы отдаются как 304 без шаблона."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def pages(self):
+        return [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'group'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        ]
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_not_modified(self):
+        for url in self.pages():
+            with self.subTest(url=url):
+                # Первый ответ ставит cookie CSRF, она входит в ETag
+                self.client.get(url)
+                etag = self.client.get(url)['ETag']
+                # Сессия и пользователь для шапки страницы
+                with self.assertNumQueries(2):
+                    response = self.revalidate(url, etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(response.templates, [])
+
+    def test_new_post_changes_feeds(self):
+        etags = {url: self.client.get(url)['ETag'] for url in self.pages()}
+        Post.objects.create(text='Новый', author=self.author, group=self.group)
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_comment_and_edit_change_post_page(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий')
+        response = self.revalidate(url, etag)
+        self.assertContains(response, 'Комментарий')
+        etag = response['ETag']
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный пост'
+        post.save()
+        self.assertContains(self.revalidate(url, etag), 'Исправленный пост')
+
+    def test_etag_depends_on_user(self):
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        self.client.logout()
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+
+class PageCacheTests(TestCase):
+    """Закэшированная страница ленты не уносит с собой чужих cookie."""
+
+    def setUp(self):
+        cache.clear()
+        self.renders = 0
+
+    def get(self, view):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        return cache_feed('test')(view)(request)
+
+    def view(self, request):
+        self.renders += 1
+        return HttpResponse('Лента')
+
+    def test_page_cached_with_vary_cookie(self):
+        self.get(self.view)
+        response = self.get(self.view)
+        self.assertEqual(self.renders, 1)
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_response_with_cookie_not_cached(self):
+        def view(request):
+            response = self.view(request)
+            response.set_cookie('visitor', 'first')
+            return response
+
+        self.get(view)
+        response = self.get(view)
+        self.assertEqual(self.renders, 2)
+        self.assertEqual(response.cookies['visitor'].value, 'first')
+
+    def test_private_response_not_cached(self):
+        def view(request):
+            response = self.view(request)
+            response['Cache-Control'] = 'private'
+            return response
+
+        self.get(view)
+        self.get(view)
+        self.assertEqual(self.renders, 2)
+
+
+@mock.patch('core.parallel.QUERY_WORKERS', 2)
+class ParallelReadsTests(TransactionTestCase):
+    """Страницы с gather() вне транзакции TestCase: чтения идут в пуле."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(text='Параллельный пост',
+                                        author=self.user)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Комментарий')
+        self.client.force_login(self.user)
+
+    def get(self, url):
+        with mock.patch('core.parallel._run', wraps=parallel._run) as run:
+            response = self.client.get(url)
+        self.assertTrue(run.called)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_profile(self):
+        response = self.get(
+            reverse('posts:profile', kwargs={'username': 'auth'}))
+        self.assertEqual(response.context['author'], self.user)
+        self.assertEqual(response.context['post_count'], 1)
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+        self.assertFalse(response.context['following'])
+
+    def test_post_detail(self):
+        response = self.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        self.assertEqual(response.context['post'], self.post)
+        self.assertEqual(response.context['post_count'], 1)
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            ['Комментарий'])
@@ -0,0 +1,247 @@
+import hashlib
+
+from django.db import transaction
+from django.templatetags.static import static
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import (DummyImageFile, ImageFile,
+                                   deserialize_image_file)
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import \
+    KVStore as CachedDBKVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.cache import app_cache
+from core.tasks import task
+from yatube.settings import (POST_THUMBNAIL_FORMATS, POST_THUMBNAIL_WIDTHS,
+                             POST_THUMBNAILS, TASK_LEASE)
+
+from . import cards
+from .feeds import post_feeds
+from .models import Post
+from .page_cache import invalidate
+
+try:
+    # AVIF в Pillow добавляет отдельный плагин
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+MIME_TYPES = {
+    'AVIF': 'image/avif',
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+}
+# sorl не знает расширения AVIF
+EXTENSIONS.setdefault('AVIF', 'avif')
+
+cache = app_cache('posts')
+
+
+class Placeholder(DummyImageFile):
+    """Заглушка размера миниатюры, пока та не готова."""
+
+    @property
+    def url(self):
+        return static('img/placeholder.svg')
+
+
+class Picture:
+    """Картинка поста для `<picture>`: запасной src и srcset по форматам."""
+
+    def __init__(self, fallback, srcset='', sources=()):
+        self.url = fallback.url
+        self.width = fallback.width
+        self.height = fallback.height
+        self.srcset = srcset
+        # [(MIME-тип, srcset)] от самого экономного формата
+        self.sources = list(sources)
+
+
+class QueuedThumbnailBackend(ThumbnailBackend):
+    """Отдаёт только готовые миниатюры.
+
+    Если миниатюры ещё нет, `{% thumbnail %}` получает заглушку,
+    а сборка ставится в очередь: страница не ждёт Pillow.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        thumbnail = self.thumbnail_file(file_, geometry_string, options)
+        cached = default.kvstore.get(thumbnail)
+        if cached:
+            return cached
+        instance = getattr(file_, 'instance', None)
+        if isinstance(instance, Post):
+            schedule(instance)
+        return Placeholder(geometry_string)
+
+    def thumbnail_file(self, file_, geometry_string, options):
+        """Файл миниатюры с тем именем, под которым её сохранит sorl."""
+        source = ImageFile(file_)
+        name = self._get_thumbnail_filename(
+            source, geometry_string, self._full_options(source, options))
+        return ImageFile(name, default.storage)
+
+    def generate(self, file_, geometry_string, **options):
+        return super().get_thumbnail(file_, geometry_string, **options)
+
+    def _full_options(self, source, options):
+        # Те же умолчания, что в ThumbnailBackend.get_thumbnail:
+        # от них зависит имя файла миниатюры
+        options = dict(options)
+        if settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return options
+
+
+def _kvstore_get_many(keys):
+    """Сырые значения kvstore sorl по ключам: get_many из кэша
+    и один запрос к таблице за промахами."""
+    store = default.kvstore
+    if not isinstance(store, CachedDBKVStore):
+        values = {key: store._get_raw(key) for key in keys}
+        return {key: value for key, value in values.items() if value}
+    values = store.cache.get_many(keys)
+    missing = set(keys) - values.keys()
+    if missing:
+        rows = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        # Как и sorl, запоминаем отсутствие, чтобы не ходить в базу снова
+        store.cache.set_many(
+            {key: rows.get(key, EMPTY_VALUE) for key in missing},
+            settings.THUMBNAIL_CACHE_TIMEOUT,
+        )
+        values.update(rows)
+    return {
+        key: value for key, value in values.items() if value != EMPTY_VALUE
+    }
+
+
+def modern_formats():
+    """Форматы из POST_THUMBNAIL_FORMATS, которые умеет сохранять Pillow."""
+    Image.init()
+    return [
+        image_format for image_format in POST_THUMBNAIL_FORMATS
+        if image_format in Image.SAVE
+        and image_format != settings.THUMBNAIL_FORMAT
+    ]
+
+
+def derivatives(size):
+    """Варианты картинки размера size: [(формат, ширина, geometry, options)].
+
+    Для каждого формата — несколько ширин с пропорциями основной
+    миниатюры. Основная миниатюра — запасной формат наибольшей ширины.
+    """
+    geometry, options = POST_THUMBNAILS[size]
+    width, height = map(int, geometry.split('x'))
+    widths = sorted(
+        {value for value in POST_THUMBNAIL_WIDTHS if value < width} | {width})
+    variants = []
+    for image_format in modern_formats() + [None]:
+        for value in widths:
+            variant_options = dict(options)
+            if image_format:
+                variant_options['format'] = image_format
+            variants.append((
+                image_format or settings.THUMBNAIL_FORMAT,
+                value,
+                f'{value}x{round(value * height / width)}',
+                variant_options,
+            ))
+    return variants
+
+
+def _srcset(images):
+    return ', '.join(f'{image.url} {width}w' for width, image in images)
+
+
+def with_thumbnails(posts, size):
+    """Проставляет постам `thumbnail` размера size из POST_THUMBNAILS.
+
+    Все варианты картинок страницы ищутся одним обращением к kvstore
+    вместо поиска в каждом `{% thumbnail %}`. Пока основной миниатюры
+    нет — заглушка; недостающие варианты ставятся в очередь сборки.
+    """
+    geometry = POST_THUMBNAILS[size][0]
+    variants = derivatives(size)
+    backend = QueuedThumbnailBackend()
+    posts = list(posts)
+    keys = {}
+    for post in posts:
+        post.thumbnail = None
+        if post.image:
+            keys[post.pk] = [
+                add_prefix(backend.thumbnail_file(
+                    post.image, variant_geometry, options).key)
+                for _, _, variant_geometry, options in variants
+            ]
+    values = _kvstore_get_many(
+        [key for post_keys in keys.values() for key in post_keys])
+    for post in posts:
+        if post.pk not in keys:
+            continue
+        ready = {}
+        for (image_format, width, _, _), key in zip(variants, keys[post.pk]):
+            if key in values:
+                ready.setdefault(image_format, []).append(
+                    (width, deserialize_image_file(values[key])))
+        if sum(map(len, ready.values())) < len(variants):
+            schedule(post)
+        fallback = ready.pop(settings.THUMBNAIL_FORMAT, [])
+        if not fallback or fallback[-1][0] != variants[-1][1]:
+            # Нет основной миниатюры
+            post.thumbnail = Picture(Placeholder(geometry))
+            continue
+        post.thumbnail = Picture(
+            fallback[-1][1],
+            srcset=_srcset(fallback),
+            sources=[
+                (MIME_TYPES.get(image_format, ''), _srcset(images))
+                for image_format, images in ready.items()
+            ],
+        )
+    return posts
+
+
+# Pillow работает долго, а пишет sorl только в свой kvstore: без
+# транзакции, которая на SQLite держала бы блокировку записи
+@task(atomic=False)
+def generate(post_id):
+    """Собирает все варианты картинки поста для размеров POST_THUMBNAILS."""
+    post = Post.objects.select_related('author').filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    backend = QueuedThumbnailBackend()
+    for size in POST_THUMBNAILS:
+        for _, _, geometry, options in derivatives(size):
+            backend.generate(post.image, geometry, **options)
+    # Карточки и страницы с заглушкой пора перестроить
+    cards.bump('post', post.pk)
+    invalidate(*post_feeds(post))
+
+
+def _enqueue(post_id, image_name):
+    # Пост с заглушкой показывают много раз, пока миниатюр нет: задачу
+    # на картинку ставим раз в TASK_LEASE, а не запрос в очередь
+    # на каждый показ. Новая картинка — новое имя файла и новая задача
+    digest = hashlib.md5(image_name.encode()).hexdigest()
+    if cache.add(f'thumbnails_queued:{post_id}:{digest}', 1, TASK_LEASE):
+        generate.enqueue(post_id, key=f'thumbnails:{post_id}')
+
+
+def schedule(post):
+    """Ставит сборку миниатюр поста в очередь после коммита."""
+    image_name = post.image.name
+    transaction.on_commit(lambda: _enqueue(post.pk, image_name))
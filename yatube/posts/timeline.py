@@ -0,0 +1,161 @@
+from django.utils.functional import cached_property
+
+from core.paginator import CursorPaginator, keyset
+from core.parallel import gather
+from core.tasks import task
+from yatube.settings import TIMELINE_BACKFILL, TIMELINE_FANOUT_LIMIT
+
+from .feeds import CARD_FIELDS, feed
+from .models import Follow, Post, TimelineEntry, UserCounter
+from .page_cache import invalidate
+
+BATCH_SIZE = 500
+
+
+def is_popular(author_id):
+    """Посты автора не раскладываются по лентам, а подмешиваются
+    при чтении. Решают тот же счётчик и порог, что и в popular_authors:
+    иначе пост мог бы не попасть ни в ленты, ни в выдачу."""
+    return UserCounter.objects.filter(
+        user_id=author_id,
+        followers_count__gt=TIMELINE_FANOUT_LIMIT,
+    ).exists()
+
+
+@task
+def fan_out(post_id):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    post = Post.objects.filter(pk=post_id).values(
+        'author_id', 'pub_date').first()
+    if post is None or is_popular(post['author_id']):
+        # Популярный автор: подписчики прочитают его посты из Post
+        return
+    followers = list(Follow.objects.filter(
+        author_id=post['author_id']).values_list('user_id', flat=True))
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id, post_id=post_id, pub_date=post['pub_date'])
+            for user_id in followers
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    invalidate(*(f'timeline:{user_id}' for user_id in followers))
+
+
+@task
+def backfill(user_id, author_id):
+    """Добавляет в ленту пользователя последние посты нового автора."""
+    if not Follow.objects.filter(
+            user_id=user_id, author_id=author_id).exists():
+        # Успел отписаться, пока задача ждала в очереди
+        return
+    posts = (
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date')
+        .values_list('pk', 'pub_date')[:TIMELINE_BACKFILL]
+    )
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    invalidate(f'timeline:{user_id}')
+
+
+@task
+def prune(user_id, author_id):
+    """Убирает из ленты пользователя посты автора, от которого
+    он отписался."""
+    if Follow.objects.filter(user_id=user_id, author_id=author_id).exists():
+        # Подписался снова, пока задача ждала в очереди
+        return
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+    invalidate(f'timeline:{user_id}')
+
+
+@task
+def refill(author_id):
+    """Автор перестал быть популярным: его посты больше не подмешиваются
+    при чтении, поэтому раскладываем их по лентам всех подписчиков."""
+    if is_popular(author_id):
+        return
+    for user_id in Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True):
+        backfill.enqueue(user_id, author_id)
+
+
+def follower_lost(author_id):
+    """После отписки: если число подписчиков опустилось до порога,
+    ставит refill."""
+    if UserCounter.objects.filter(
+            user_id=author_id,
+            followers_count=TIMELINE_FANOUT_LIMIT).exists():
+        refill.enqueue(author_id, key=f'timeline:refill:{author_id}')
+
+
+def popular_authors(user):
+    """Авторы из подписок user, чьи посты не раскладываются по лентам."""
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__counters__followers_count__gt=TIMELINE_FANOUT_LIMIT,
+        ).values_list('author_id', flat=True)
+    )
+
+
+class TimelinePaginator(CursorPaginator):
+    """Лента подписок из TimelineEntry плюс посты популярных авторов.
+
+    Ключ курсора у обоих источников общий — (pub_date, id поста), поэтому
+    выборки сливаются без повторного запроса.
+    """
+
+    def __init__(self, object_list, per_page, user, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.user = user
+
+    @cached_property
+    def popular(self):
+        return popular_authors(self.user)
+
+    @staticmethod
+    def _entries(queryset):
+        return queryset.select_related(
+            'post__author', 'post__group'
+        ).only(
+            # user_id нужен менеджеру user.timeline, иначе будет догрузка
+            'user_id', 'pub_date', 'post_id',
+            *(f'post__{field}' for field in CARD_FIELDS),
+        )
+
+    def fetch(self, position, limit, reverse=False):
+        entries = self._entries(
+            keyset(self.object_list, position, reverse, pk_field='post_id'))
+        # Популярные авторы читаются вместе с записями ленты
+        posts, popular = gather(
+            lambda: [entry.post for entry in entries[:limit]],
+            lambda: self.popular,
+        )
+        if not popular:
+            return posts
+        posts += keyset(
+            feed(author__in=self.popular), position, reverse)[:limit]
+        unique = {post.pk: post for post in posts}.values()
+        return sorted(
+            unique,
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=not reverse,
+        )[:limit]
+
+    def fetch_offset(self, offset, limit):
+        if self.popular:
+            return self.fetch(None, offset + limit)[offset:]
+        entries = self._entries(
+            keyset(self.object_list, None, pk_field='post_id'))
+        return [entry.post for entry in entries[offset:offset + limit]]
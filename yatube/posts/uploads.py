@@ -0,0 +1,87 @@
+import os
+import tempfile
+
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from PIL import Image, ImageOps, ImageSequence
+
+from yatube.settings import POST_IMAGE_MAX_SIDE
+
+# Результат крупнее держим не в памяти, а во временном файле
+SPOOL_MAX_SIZE = 2 ** 20
+# Формат загруженной картинки: (формат сохранения, расширение, параметры)
+SAVE_AS = {
+    'JPEG': ('JPEG', 'jpg', {'quality': 90, 'optimize': True}),
+    # Снимки камер телефонов: JPEG с дополнительными кадрами (превью,
+    # карта глубины). Сохраняется основной кадр
+    'MPO': ('JPEG', 'jpg', {'quality': 90, 'optimize': True}),
+    'PNG': ('PNG', 'png', {'optimize': True}),
+    'GIF': ('GIF', 'gif', {}),
+    'WEBP': ('WEBP', 'webp', {'quality': 90}),
+}
+# Форматы, анимация которых сохраняется со всеми кадрами
+ANIMATED = {'GIF', 'PNG', 'WEBP'}
+
+
+def _frame_count(image):
+    if image.format in ANIMATED:
+        return getattr(image, 'n_frames', 1)
+    return 1
+
+
+def frame_count(upload):
+    """Сколько кадров загруженной картинки декодирует reencode.
+    Кадры считаются по заголовкам, без декодирования пикселей."""
+    upload.seek(0)
+    with Image.open(upload) as image:
+        return _frame_count(image)
+
+
+def _fit(image):
+    image.thumbnail((POST_IMAGE_MAX_SIDE, POST_IMAGE_MAX_SIDE))
+    return image
+
+
+def _frames(source, options):
+    """Кадры анимации, уменьшенные как картинка, и параметры
+    сохранения с их длительностью и повтором."""
+    frames = [_fit(frame.copy()) for frame in ImageSequence.Iterator(source)]
+    options = {
+        **options,
+        'save_all': True,
+        'append_images': frames[1:],
+        'duration': [frame.info.get('duration', 100) for frame in frames],
+        'loop': source.info.get('loop', 0),
+    }
+    return frames[0], options
+
+
+def reencode(upload):
+    """Пересохраняет картинку без EXIF и прочих метаданных.
+
+    JPEG декодируется сразу в уменьшенном масштабе (draft), поэтому
+    память на декодирование ограничена POST_IMAGE_MAX_SIDE, а не
+    размером исходника. Картинки крупнее POST_IMAGE_MAX_SIDE
+    уменьшаются, ориентация из EXIF применяется к пикселям.
+    Анимированные GIF, PNG и WebP сохраняются со всеми кадрами.
+    """
+    upload.seek(0)
+    with Image.open(upload) as source:
+        image_format, extension, options = SAVE_AS[source.format]
+        if image_format == 'JPEG':
+            source.draft('RGB', (POST_IMAGE_MAX_SIDE, POST_IMAGE_MAX_SIDE))
+        icc_profile = source.info.get('icc_profile')
+        if _frame_count(source) > 1:
+            image, options = _frames(source, options)
+        else:
+            image = _fit(ImageOps.exif_transpose(source))
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    if icc_profile:
+        options = {**options, 'icc_profile': icc_profile}
+    content = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    image.save(content, image_format, **options)
+    size = content.tell()
+    content.seek(0)
+    name = f'{os.path.splitext(upload.name)[0]}.{extension}'
+    return InMemoryUploadedFile(
+        content, 'image', name, Image.MIME[image_format], size, None)
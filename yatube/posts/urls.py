@@ -1,18 +1,32 @@
 from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import path
-from django.views.decorators.cache import cache_page
 
 from . import views
+from .page_cache import cache_feed
 
 app_name = 'posts'
 
 urlpatterns = [
-    path('', cache_page(20)(views.index), name='index'),
-    path('group/<slug:slug>/', views.group_posts, name='group_list'),
-    path('profile/<str:username>/', views.profile, name='profile'),
+    path('', cache_feed('index')(views.index), name='index'),
+    path(
+        'group/<slug:slug>/',
+        cache_feed('group:{slug}')(views.group_posts),
+        name='group_list'
+    ),
+    path(
+        'profile/<str:username>/',
+        cache_feed('profile:{username}')(views.profile),
+        name='profile'
+    ),
+    path('search/', views.search_posts, name='search'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.comments,
+        name='comments'
+    ),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path(
         'posts/<int:post_id>/comment/',
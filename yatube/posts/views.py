@@ -1,12 +1,28 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.shortcuts import get_object_or_404, redirect, render
 
-from yatube.settings import COUNT_LISTS
+from core.conditional import conditional_page
+from core.db import primary
+from core.paginator import paginate
+from core.parallel import gather
+from yatube.settings import COMMENTS_PER_PAGE, COUNT_LISTS
 
+from .cards import (VERSION_KEY, card_keys, changed_recently, get_versions,
+                    with_card_versions)
+from .counters import get_counters
+from .feeds import feed
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post
+from .hot import get_group, get_post
+from .page_cache import (feed_changed, feed_generation,
+                         primary_while_changed)
+from .models import Comment, Follow, Post
+from .search import SearchResults
+from .thumbnails import with_thumbnails
+from .timeline import TimelinePaginator
 
 User = get_user_model()
 
@@ -14,10 +30,10 @@ User = get_user_model()
 def index(request):
     title = 'Главная страница'
     template = 'posts/index.html'
-    post_list = Post.objects.select_related('group').all()
-    paginator = Paginator(post_list, COUNT_LISTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = feed()
+    page_obj = paginate(request, post_list)
+    with_card_versions(page_obj)
+    with_thumbnails(page_obj, 'feed')
 
     context = {
         'title': title,
@@ -28,11 +44,13 @@ def index(request):
 
 def group_posts(request, slug):
     template = 'posts/group_list.html'
-    group = get_object_or_404(Group, slug=slug)
-    post_list = Post.objects.filter(group=group)
-    paginator = Paginator(post_list, COUNT_LISTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Лента читается по slug, не дожидаясь группы
+    group, page_obj = gather(
+        lambda: get_group(slug),
+        lambda: paginate(request, feed(group__slug=slug)),
+    )
+    with_card_versions(page_obj)
+    with_thumbnails(page_obj, 'feed')
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -42,33 +60,103 @@ def group_posts(request, slug):
 
 def profile(request, username):
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    post_count = post_list.count()
-    paginator = Paginator(post_list, COUNT_LISTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    following = False
+    authors = User.objects.select_related('counters')
     if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            author=author, user=request.user).exists()
+        # Подписка — в том же запросе, что автор и его счётчики
+        authors = authors.annotate(is_followed=Exists(Follow.objects.filter(
+            author=OuterRef('pk'), user=request.user)))
+    # Автор и страница ленты читаются одновременно
+    author, page_obj = gather(
+        lambda: get_object_or_404(authors, username=username),
+        lambda: paginate(request, feed(author__username=username)),
+    )
+    counters = get_counters(author)
+    with_card_versions(page_obj)
+    with_thumbnails(page_obj, 'feed')
     context = {
         'author': author,
-        'post_count': post_count,
+        'post_count': counters.posts_count,
+        'counters': counters,
+        'page_obj': page_obj,
+        'following': getattr(author, 'is_followed', False),
+    }
+    return render(request, template, context)
+
+
+# Карточки поиска общие с главной, а любая правка карточки меняет
+# и главную
+@primary_while_changed('index')
+def search_posts(request):
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        paginator = Paginator(SearchResults(query), COUNT_LISTS)
+        page_obj = paginator.get_page(request.GET.get('page'))
+        with_card_versions(page_obj)
+        with_thumbnails(page_obj, 'feed')
+    context = {
+        'query': query,
         'page_obj': page_obj,
-        'following': following,
     }
     return render(request, template, context)
 
 
+def comment_page(request, post_id):
+    """Порция комментариев поста от новых к старым по `?cursor=`."""
+    comments = Comment.objects.filter(post=post_id).select_related(
+        'author').only('text', 'created', 'post_id', 'author__username')
+    return paginate(
+        request,
+        comments,
+        per_page=COMMENTS_PER_PAGE,
+        date_field='created',
+    )
+
+
+def _post_keys(post):
+    return [
+        *card_keys(post),
+        VERSION_KEY.format(kind='comments', pk=post.pk),
+    ]
+
+
+def post_state(request, post_id):
+    """Версии всего, что показывает страница поста, без запросов к базе.
+
+    Пост, автор и группа — версии их карточек, комментарии — своя
+    версия, число постов автора меняется вместе с лентой его профиля.
+    """
+    post = get_post(post_id)
+    keys = _post_keys(post)
+    versions = get_versions(keys)
+    return (
+        [versions[key] for key in keys],
+        feed_generation(f'profile:{post.author.username}'),
+    )
+
+
+def post_changed(request, post_id):
+    """Менялось ли что-то из post_state, пока реплики догоняют запись."""
+    post = get_post(post_id)
+    return (
+        changed_recently(_post_keys(post))
+        or feed_changed(f'profile:{post.author.username}')
+    )
+
+
+@conditional_page(post_state, post_changed)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_post(post_id)
+    counters, comments = gather(
+        lambda: get_counters(post.author),
+        lambda: comment_page(request, post_id),
+    )
+    with_thumbnails([post], 'detail')
     title = post.text[:30]
-    author = post.author
-    post_count = Post.objects.filter(author=author).count()
+    post_count = counters.posts_count
     form = CommentForm(request.POST or None)
-    comments = Comment.objects.filter(post=post_id).all()
     context = {
         'title': title,
         'post_id': post_id,
@@ -81,17 +169,32 @@ def post_detail(request, post_id):
 
 
 @login_required
+@primary
 def post_create(request):
     template = 'posts/create_post.html'
     form = PostForm(request.POST or None, files=request.FILES or None)
+    # Проверка формы с пересжатием картинки — вне транзакции: на SQLite
+    # она сразу берёт блокировку записи и держала бы её всё это время
     if form.is_valid():
         form.instance.author = request.user
-        form.save()
+        with transaction.atomic():
+            form.save()
         return redirect('posts:profile', request.user.username)
     return render(request, template, {'form': form})
 
 
+def comments(request, post_id):
+    """Следующая порция комментариев для догрузки на странице поста."""
+    template = 'includes/comments.html'
+    context = {
+        'post_id': get_post(post_id).pk,
+        'comments': comment_page(request, post_id),
+    }
+    return render(request, template, context)
+
+
 @login_required
+@primary
 def post_edit(request, post_id):
     template = 'posts/create_post.html'
     post = get_object_or_404(Post, pk=post_id)
@@ -115,6 +218,8 @@ def post_edit(request, post_id):
 
 
 @login_required
+@primary
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -127,11 +232,16 @@ def add_comment(request, post_id):
 
 
 @login_required
+@primary_while_changed('index')
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, COUNT_LISTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(
+        request,
+        request.user.timeline.all(),
+        paginator_class=TimelinePaginator,
+        user=request.user,
+    )
+    with_card_versions(page_obj)
+    with_thumbnails(page_obj, 'feed')
     context = {
         'page_obj': page_obj,
     }
@@ -139,6 +249,8 @@ def follow_index(request):
 
 
 @login_required
+@primary
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
@@ -147,10 +259,13 @@ def profile_follow(request, username):
 
 
 @login_required
+@primary
+@transaction.atomic
 def profile_unfollow(request, username):
-    unfollow_profile = Follow.objects.get(
+    # Сигнал удаления берёт имена автора и читателя из загруженных связей
+    unfollow_profile = Follow.objects.select_related('author', 'user').get(
         author__username=username,
         user=request.user
     )
-    Follow.objects.filter(pk=unfollow_profile.pk).delete()
+    unfollow_profile.delete()
     return redirect('posts:profile', username=username)
@@ -17,12 +17,16 @@ from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 
+from core.views import cache_stats
+
 urlpatterns = [
     path('', include('posts.urls', namespace='posts')),
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls', namespace='users')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('api/v1/', include('api.urls', namespace='api')),
+    path('cache-stats/', cache_stats, name='cache_stats'),
 ]
 
 handler400 = 'core.views.bad_request'